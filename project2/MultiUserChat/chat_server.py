@@ -8,11 +8,49 @@ from core.server_classes import ChatServer
 HOST = "0.0.0.0"
 CHAT_PORT = 9999
 
+# Socket options applied to every accepted client connection.
+# None leaves the operating system default in place.
+TCP_NODELAY = True
+SO_SNDBUF = None
+SO_RCVBUF = None
+
+# Unix socket used to hand connections to a newly started server. Starting
+# a second server with the same path takes over from the running one
+# without disconnecting anyone. None disables warm restarts.
+WARM_RESTART_PATH = None
+
+# File that receives every frame clients send, for replay with
+# tools/replay_capture.py. None disables capturing.
+CAPTURE_PATH = None
+
+
+def pop_option(args, name):
+    """Removes `name <value>` from args and returns the value, or None."""
+    if name not in args:
+        return None
+    index = args.index(name)
+    value = args[index + 1] if index + 1 < len(args) else None
+    del args[index : index + 2]
+    return value
+
+
 if __name__ == "__main__":
 
-    if len(sys.argv) > 1:
+    args = sys.argv[1:]
+
+    # --headless runs only the chat server, without the web monitor.
+    HEADLESS = "--headless" in args
+    args = [arg for arg in args if arg != "--headless"]
+
+    # --warm-restart <path> enables handoffs, see WARM_RESTART_PATH.
+    WARM_RESTART_PATH = pop_option(args, "--warm-restart") or WARM_RESTART_PATH
+
+    # --capture <path> records client traffic, see CAPTURE_PATH.
+    CAPTURE_PATH = pop_option(args, "--capture") or CAPTURE_PATH
+
+    if args:
         try:
-            CHAT_PORT = int(sys.argv[1])
+            CHAT_PORT = int(args[0])
         except ValueError:
             print("Invalid port number provided. Using default 9999.")
 
@@ -21,7 +59,23 @@ if __name__ == "__main__":
     print("-" * 40)
     print(f"Starting Chat Server on {HOST}:{CHAT_PORT}")
     print(f"Admin Password: {ADMIN_PASS}")
+    if HEADLESS:
+        print("Headless mode: web monitor disabled")
+    if WARM_RESTART_PATH:
+        print(f"Warm restart socket: {WARM_RESTART_PATH}")
+    if CAPTURE_PATH:
+        print(f"Capturing client traffic to: {CAPTURE_PATH}")
     print("-" * 40)
 
-    server = ChatServer(host=HOST, chat_port=CHAT_PORT, admin_pass=ADMIN_PASS)
+    server = ChatServer(
+        host=HOST,
+        chat_port=CHAT_PORT,
+        admin_pass=ADMIN_PASS,
+        tcp_nodelay=TCP_NODELAY,
+        send_buffer_size=SO_SNDBUF,
+        recv_buffer_size=SO_RCVBUF,
+        headless=HEADLESS,
+        warm_restart_path=WARM_RESTART_PATH,
+        capture_path=CAPTURE_PATH,
+    )
     server.start()
@@ -0,0 +1,563 @@
+import os
+import time
+import asyncio
+import random
+import secrets
+from collections import OrderedDict, deque
+from .protocol import MessageProtocol, FrameBuffer
+
+EVENT_DISCONNECTED = "DISCONNECTED"
+EVENT_RECONNECTED = "RECONNECTED"
+EVENT_CLOSED = "CLOSED"
+
+WRITE_HIGH_WATER = 64 * 1024
+MAX_AWAITED_RECEIPTS = 1000
+
+
+FILE_FRAME_TYPES = {
+    MessageProtocol.TYPE_FILE_OFFER,
+    MessageProtocol.TYPE_FILE_ACCEPT,
+    MessageProtocol.TYPE_FILE_CHUNK,
+    MessageProtocol.TYPE_FILE_ACK,
+    MessageProtocol.TYPE_FILE_END,
+    MessageProtocol.TYPE_FILE_CANCEL,
+}
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+class FileTransferError(Exception):
+    pass
+
+
+class RttStats:
+    """Running latency statistics over the most recent samples."""
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def snapshot(self):
+        if not self.samples:
+            return {"count": self.count}
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "min_ms": round(ordered[0] * 1000, 3),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+            "p99_ms": round(ordered[int(len(ordered) * 0.99)] * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3),
+        }
+
+
+class _PendingMessage:
+    def __init__(self, line, receipt, future):
+        self.line = line
+        self.receipt = receipt
+        self.future = future
+        self.sent_at = 0.0
+        self.sent_wall = 0.0
+
+
+class _OutgoingTransfer:
+    def __init__(self, accepted):
+        self.accepted = accepted
+        self.window = None
+        self.window_size = 0
+        self.error = None
+
+
+class _IncomingTransfer:
+    def __init__(self, file, path, size):
+        self.file = file
+        self.path = path
+        self.size = size
+        self.received = 0
+
+
+class AsyncChatClient:
+    """asyncio client for the chat protocol, independent of any UI.
+
+    Sends are pipelined: lines are written to the transport without
+    waiting, and the writer is only drained once its buffer passes
+    WRITE_HIGH_WATER. Incoming frames are decoded and delivered through
+    ``async for msg_type, data in client``. If the connection drops after
+    a successful login, the client reconnects with jittered exponential
+    backoff, resuming the session with the server's resume token when it
+    can and logging in again with the same credentials otherwise.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=9999,
+        reconnect=True,
+        initial_backoff=0.5,
+        max_backoff=30.0,
+        max_reconnect_attempts=None,
+    ):
+        self.host = host
+        self.port = port
+        self.reconnect = reconnect
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_reconnect_attempts = max_reconnect_attempts
+
+        self.nickname = None
+        self.password = None
+        self.resume_token = None
+        self.reader = None
+        self.writer = None
+        self.frame_buffer = None
+        self.pending_frames = []
+        self.read_task = None
+        self.closing = False
+        self.connected = asyncio.Event()
+        self.messages = asyncio.Queue()
+
+        self.offers = {}
+        self.outgoing = {}
+        self.incoming = {}
+
+        self.message_prefix = secrets.token_hex(3)
+        self.message_counter = 0
+        self.unacked = OrderedDict()
+        self.awaited_receipts = OrderedDict()
+        self.ack_rtt = RttStats()
+        self.receipt_latency = RttStats()
+        self.clock_offset = None
+
+    async def open(self):
+        """Open the TCP connection and return the server's AUTH_REQ text."""
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.frame_buffer = FrameBuffer(chunk_prefix=MessageProtocol.FILE_CHUNK_HEADER)
+        self.pending_frames = []
+
+        while True:
+            msg_type, data = await self._read_message()
+            if msg_type == MessageProtocol.TYPE_AUTH_REQ:
+                return data.get("content", "")
+            self.messages.put_nowait((msg_type, data))
+
+    async def login(self, nickname, password):
+        """Authenticate on an open connection. Raises AuthenticationError."""
+        self.writer.write(f"{nickname} {password}\n".encode(MessageProtocol.ENCODING))
+        data = await self._await_auth()
+
+        self.nickname = nickname
+        self.password = password
+        return self._authenticated(data)
+
+    async def resume(self):
+        """Resume the previous session on an open connection using the
+        server-issued token, skipping the password check."""
+        if not self.resume_token:
+            raise AuthenticationError("No resume token available.")
+        self.writer.write(
+            f"{MessageProtocol.CMD_RESUME} {self.resume_token}\n".encode(
+                MessageProtocol.ENCODING
+            )
+        )
+        return self._authenticated(await self._await_auth())
+
+    async def _await_auth(self):
+        while True:
+            msg_type, data = await self._read_message()
+            if msg_type == MessageProtocol.TYPE_AUTH_SUCCESS:
+                return data
+            if msg_type == MessageProtocol.TYPE_AUTH_FAIL:
+                raise AuthenticationError(data.get("content", "Authentication failed."))
+            self.messages.put_nowait((msg_type, data))
+
+    def _authenticated(self, data):
+        self.resume_token = data.get("resume_token")
+        self.connected.set()
+        if self.read_task is None:
+            self.read_task = asyncio.get_running_loop().create_task(self._read_loop())
+        return data.get("content", "")
+
+    async def connect(self, nickname, password):
+        await self.open()
+        return await self.login(nickname, password)
+
+    async def _read_message(self):
+        while True:
+            while self.pending_frames:
+                frame, payload = self.pending_frames.pop(0)
+                msg_type, data = MessageProtocol.decode_message(frame)
+                if msg_type:
+                    if payload is not None:
+                        data["payload"] = payload
+                    return msg_type, data
+
+            data = await self.reader.read(65536)
+            if not data:
+                raise ConnectionResetError("Server closed the connection.")
+            self.pending_frames = self.frame_buffer.feed(data)
+
+    async def _read_loop(self):
+        while not self.closing:
+            try:
+                msg_type, data = await self._read_message()
+                if msg_type == MessageProtocol.TYPE_SESSION:
+                    self.resume_token = data.get("resume_token", self.resume_token)
+                elif msg_type in FILE_FRAME_TYPES:
+                    if self._handle_file_frame(msg_type, data):
+                        self.messages.put_nowait((msg_type, data))
+                elif msg_type == MessageProtocol.TYPE_ACK:
+                    self._handle_ack(data)
+                elif msg_type == MessageProtocol.TYPE_RECEIPT:
+                    self._handle_receipt(data)
+                    self.messages.put_nowait((msg_type, data))
+                else:
+                    if msg_type == MessageProtocol.TYPE_PRIVATE and data.get("receipt"):
+                        self.writer.write(
+                            f"/receipt {data.get('sender')} {data.get('id')}\n".encode(
+                                MessageProtocol.ENCODING
+                            )
+                        )
+                    self.messages.put_nowait((msg_type, data))
+                continue
+            except (ConnectionError, OSError, ValueError) as e:
+                reason = str(e)
+
+            self.connected.clear()
+            self._close_transport()
+            self._fail_transfers("connection lost")
+            if self.closing:
+                break
+
+            self.messages.put_nowait((EVENT_DISCONNECTED, {"content": reason}))
+            if not self.reconnect or not await self._reconnect():
+                break
+
+        self.closing = True
+        self.connected.clear()
+        for pending in self.unacked.values():
+            pending.future.cancel()
+        self.unacked.clear()
+        self.messages.put_nowait((EVENT_CLOSED, {}))
+
+    async def _reconnect(self):
+        attempt = 0
+        while not self.closing:
+            if (
+                self.max_reconnect_attempts is not None
+                and attempt >= self.max_reconnect_attempts
+            ):
+                return False
+
+            backoff = min(self.max_backoff, self.initial_backoff * (2**attempt))
+            await asyncio.sleep(random.uniform(backoff / 2, backoff))
+            attempt += 1
+
+            try:
+                await self.open()
+                try:
+                    content = await self.resume()
+                    resumed = True
+                except AuthenticationError:
+                    content = await self.login(self.nickname, self.password)
+                    resumed = False
+            except AuthenticationError as e:
+                self.messages.put_nowait((EVENT_DISCONNECTED, {"content": str(e)}))
+                return False
+            except (ConnectionError, OSError, ValueError):
+                self._close_transport()
+                continue
+
+            self.messages.put_nowait(
+                (
+                    EVENT_RECONNECTED,
+                    {"content": content, "attempts": attempt, "resumed": resumed},
+                )
+            )
+            self._resend_unacked()
+            return True
+        return False
+
+    def _close_transport(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    async def send(self, text):
+        """Send one raw input line, e.g. "hello" or "/msg bob hi"."""
+        await self.connected.wait()
+        self.writer.write(f"{text}\n".encode(MessageProtocol.ENCODING))
+        if self.writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+            await self.writer.drain()
+
+    async def send_tracked(self, line, receipt=False, wait=False):
+        """Send a public or /msg line tagged with a new message id. Returns
+        the id, or with wait=True the server's ACK (with an "rtt" field).
+        Unacknowledged lines are sent again with the same id after a
+        reconnect; the server drops the duplicates."""
+        self.message_counter += 1
+        msg_id = f"{self.message_prefix}-{self.message_counter:x}"
+        pending = _PendingMessage(
+            line, receipt, asyncio.get_running_loop().create_future()
+        )
+        self.unacked[msg_id] = pending
+
+        await self.connected.wait()
+        self._write_tracked(msg_id, pending)
+        if self.writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+            await self.writer.drain()
+
+        if wait:
+            return await pending.future
+        return msg_id
+
+    def _write_tracked(self, msg_id, pending):
+        pending.sent_at = time.perf_counter()
+        pending.sent_wall = time.time()
+        flag = "!" if pending.receipt else ""
+        self.writer.write(
+            f"{MessageProtocol.MESSAGE_ID_CMD}{msg_id}{flag} {pending.line}\n".encode(
+                MessageProtocol.ENCODING
+            )
+        )
+
+    def _resend_unacked(self):
+        for msg_id, pending in self.unacked.items():
+            self._write_tracked(msg_id, pending)
+
+    def _handle_ack(self, data):
+        pending = self.unacked.pop(data.get("id"), None)
+        if pending is None:
+            return
+
+        rtt = time.perf_counter() - pending.sent_at
+        self.ack_rtt.record(rtt)
+        if isinstance(data.get("ts"), (int, float)):
+            # Server clock minus ours, assuming a symmetric path.
+            self.clock_offset = data["ts"] - (pending.sent_wall + rtt / 2)
+
+        if pending.receipt and data.get("status") == "sent":
+            self.awaited_receipts[data["id"]] = pending.sent_at
+            if len(self.awaited_receipts) > MAX_AWAITED_RECEIPTS:
+                self.awaited_receipts.popitem(last=False)
+
+        data["rtt"] = rtt
+        if not pending.future.done():
+            pending.future.set_result(data)
+
+    def _handle_receipt(self, data):
+        sent_at = self.awaited_receipts.pop(data.get("id"), None)
+        if sent_at is not None:
+            data["latency"] = time.perf_counter() - sent_at
+            self.receipt_latency.record(data["latency"])
+
+    def stats(self):
+        return {
+            "ack_rtt": self.ack_rtt.snapshot(),
+            "receipt_latency": self.receipt_latency.snapshot(),
+            "unacked": len(self.unacked),
+            "clock_offset_ms": (
+                round(self.clock_offset * 1000, 3)
+                if self.clock_offset is not None
+                else None
+            ),
+        }
+
+    async def send_public(self, content, wait=False):
+        return await self.send_tracked(content, wait=wait)
+
+    async def send_private(self, target, content, receipt=False, wait=False):
+        return await self.send_tracked(f"/msg {target} {content}", receipt, wait)
+
+    async def request_list(self):
+        await self.send("/list")
+
+    async def search(self, query):
+        await self.send(f"/search {query}")
+
+    def _handle_file_frame(self, msg_type, data):
+        """Apply a file transfer frame; returns True if it should also be
+        delivered to the application."""
+        transfer_id = data.get("id")
+
+        if msg_type == MessageProtocol.TYPE_FILE_OFFER:
+            self.offers[transfer_id] = data
+            return True
+
+        if msg_type == MessageProtocol.TYPE_FILE_ACCEPT:
+            transfer = self.outgoing.get(transfer_id)
+            if transfer and not transfer.accepted.done():
+                transfer.accepted.set_result(data)
+            return False
+
+        if msg_type == MessageProtocol.TYPE_FILE_ACK:
+            transfer = self.outgoing.get(transfer_id)
+            if transfer and transfer.window:
+                transfer.window.release()
+            return False
+
+        if msg_type == MessageProtocol.TYPE_FILE_CHUNK:
+            transfer = self.incoming.get(transfer_id)
+            payload = data.pop("payload", b"")
+            if transfer:
+                transfer.file.write(payload)
+                transfer.received += len(payload)
+                self.writer.write(
+                    f"/file ack {transfer_id} {data.get('seq')}\n".encode(
+                        MessageProtocol.ENCODING
+                    )
+                )
+            return False
+
+        if msg_type == MessageProtocol.TYPE_FILE_END:
+            transfer = self.incoming.pop(transfer_id, None)
+            if not transfer:
+                return False
+            transfer.file.close()
+            data["path"] = transfer.path
+            data["size"] = transfer.received
+            return True
+
+        if msg_type == MessageProtocol.TYPE_FILE_CANCEL:
+            self.offers.pop(transfer_id, None)
+            self._abort_transfer(transfer_id, data.get("reason", "cancelled"))
+            return True
+
+        return False
+
+    def _abort_transfer(self, transfer_id, reason):
+        outgoing = self.outgoing.get(transfer_id)
+        if outgoing:
+            outgoing.error = reason
+            if not outgoing.accepted.done():
+                outgoing.accepted.set_exception(FileTransferError(reason))
+            if outgoing.window:
+                for _ in range(outgoing.window_size):
+                    outgoing.window.release()
+
+        incoming = self.incoming.pop(transfer_id, None)
+        if incoming:
+            incoming.file.close()
+            try:
+                os.remove(incoming.path)
+            except OSError:
+                pass
+
+    def _fail_transfers(self, reason):
+        self.offers.clear()
+        for transfer_id in list(self.outgoing) + list(self.incoming):
+            self._abort_transfer(transfer_id, reason)
+
+    async def send_file(self, target, path):
+        """Offer a file to target and stream it once accepted. The file is
+        read one chunk at a time, with at most the server-granted window of
+        chunks unacknowledged. Returns the number of bytes sent."""
+        transfer_id = secrets.token_hex(8)
+        size = os.path.getsize(path)
+        name = os.path.basename(path)
+
+        transfer = _OutgoingTransfer(asyncio.get_running_loop().create_future())
+        self.outgoing[transfer_id] = transfer
+        try:
+            await self.send(f"/file offer {transfer_id} {target} {size} {name}")
+            accept = await transfer.accepted
+
+            chunk_size = min(
+                accept.get("chunk_size", MessageProtocol.MAX_CHUNK_SIZE),
+                MessageProtocol.MAX_CHUNK_SIZE,
+            )
+            transfer.window_size = max(1, accept.get("window", 1))
+            transfer.window = asyncio.Semaphore(transfer.window_size)
+
+            with open(path, "rb") as f:
+                seq = 0
+                while True:
+                    await transfer.window.acquire()
+                    if transfer.error:
+                        raise FileTransferError(transfer.error)
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        transfer.window.release()
+                        break
+
+                    self.writer.write(
+                        MessageProtocol.encode_chunk_header(
+                            transfer_id, seq, len(chunk)
+                        )
+                    )
+                    self.writer.write(chunk)
+                    if self.writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+                        await self.writer.drain()
+                    seq += 1
+
+            for _ in range(transfer.window_size):
+                await transfer.window.acquire()
+            if transfer.error:
+                raise FileTransferError(transfer.error)
+
+            await self.send(f"/file end {transfer_id}")
+            return size
+        finally:
+            self.outgoing.pop(transfer_id, None)
+
+    async def accept_file(self, transfer_id, directory="downloads"):
+        """Accept an offer; chunks are written straight to disk as they
+        arrive. Returns the destination path."""
+        offer = self.offers.pop(transfer_id, None)
+        if not offer:
+            raise FileTransferError(f"No pending offer '{transfer_id}'.")
+
+        os.makedirs(directory, exist_ok=True)
+        base, ext = os.path.splitext(os.path.basename(offer.get("name", "file")))
+        path = os.path.join(directory, base + ext)
+        copy = 1
+        while os.path.exists(path):
+            path = os.path.join(directory, f"{base} ({copy}){ext}")
+            copy += 1
+
+        self.incoming[transfer_id] = _IncomingTransfer(
+            open(path, "wb"), path, offer.get("size", 0)
+        )
+        await self.send(f"/file accept {transfer_id}")
+        return path
+
+    async def reject_file(self, transfer_id):
+        self.offers.pop(transfer_id, None)
+        await self.send(f"/file reject {transfer_id}")
+
+    async def cancel_file(self, transfer_id):
+        self._abort_transfer(transfer_id, "cancelled locally")
+        await self.send(f"/file cancel {transfer_id}")
+
+    async def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        if self.writer and self.connected.is_set():
+            try:
+                self.writer.write(f"/{MessageProtocol.CMD_EXIT}\n".encode())
+                await self.writer.drain()
+            except (ConnectionError, OSError):
+                pass
+        self.connected.clear()
+        self._close_transport()
+
+        if self.read_task:
+            self.read_task.cancel()
+            self.read_task = None
+        self.messages.put_nowait((EVENT_CLOSED, {}))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        msg_type, data = await self.messages.get()
+        if msg_type == EVENT_CLOSED:
+            self.messages.put_nowait((msg_type, data))
+            raise StopAsyncIteration
+        return msg_type, data
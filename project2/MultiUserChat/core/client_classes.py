@@ -1,52 +1,35 @@
 import threading
-import time
-import socket
+import asyncio
 import sys
 import os
 from .protocol import MessageProtocol
-
-
-class MessageListener(threading.Thread):
-    def __init__(self, client_instance, client_socket):
-        super().__init__()
-        self.client = client_instance
-        self.socket = client_socket
-        self.running = True
-
-    def run(self):
-        while self.running:
-            try:
-                data = self.socket.recv(4096)
-                if not data:
-                    print("\n[SYSTEM] Server closed the connection.")
-                    self.client.disconnect(is_remote=True)
-                    break
-
-                msg_type, data_dict = MessageProtocol.decode_message(data)
-
-                if msg_type:
-                    self.client.display_message(msg_type, data_dict)
-
-            except ConnectionAbortedError:
-                break
-            except ConnectionResetError:
-                print("\n[SYSTEM] Connection with server was lost.")
-                self.client.disconnect(is_remote=True)
-                break
-            except Exception:
-                break
+from .async_client import (
+    AsyncChatClient,
+    AuthenticationError,
+    FileTransferError,
+    EVENT_DISCONNECTED,
+    EVENT_RECONNECTED,
+)
 
 
 class ChatClient:
+    """Terminal front end. Protocol and socket I/O live in AsyncChatClient,
+    which runs on a private event loop thread; this class only reads stdin
+    and prints what the library delivers."""
+
     def __init__(self, host="127.0.0.1", port=9999):
         self.host = host
         self.port = port
-        self.socket = None
+        self.client = None
         self.nickname = None
         self.is_connected = False
         self.listener = None
         self.chat_focus = None
-        self.auth_event = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def _call(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
 
     def _handle_auth_prompt(self):
 
@@ -59,22 +42,38 @@ class ChatClient:
                 if not auth_input:
                     continue
 
-                self.send_raw_data((auth_input + "\n").encode(MessageProtocol.ENCODING))
+                parts = auth_input.split(" ", 1)
+                if len(parts) != 2:
+                    print("[AUTH FAILED] Invalid format. Use: <nickname> <password>")
+                    continue
 
-                self.auth_event.wait()
-                self.auth_event.clear()
+                try:
+                    content = self._call(self.client.login(*parts))
+                except AuthenticationError as e:
+                    print(f"[AUTH FAILED] {e}")
+                    continue
 
-                if self.nickname:
-                    break
+                print(f"[AUTH SUCCESS] {content}")
+                self.nickname = parts[0]
 
             except EOFError:
                 self.disconnect()
                 break
-            except Exception:
+            except Exception as e:
+                print(f"\n[SYSTEM] Connection with server was lost: {e}")
+                self.disconnect(is_remote=True)
                 break
 
         return self.nickname is not None
 
+    async def _listen(self):
+        async for msg_type, data in self.client:
+            self.display_message(msg_type, data)
+
+        if self.is_connected:
+            print("\n[SYSTEM] Connection with server was lost.")
+            self.disconnect(is_remote=True)
+
     def re_prompt(self):
         """Thread-safe prompt writing."""
         if self.nickname and self.is_connected:
@@ -92,19 +91,15 @@ class ChatClient:
 
         elif msg_type == MessageProtocol.TYPE_AUTH_FAIL:
             print(f"[AUTH FAILED] {content}")
-            self.auth_event.set()
 
         elif msg_type == MessageProtocol.TYPE_AUTH_SUCCESS:
             print(f"[AUTH SUCCESS] {content}")
-            try:
-                if "Welcome back, " in content:
-                    nickname_part = content.split("Welcome back, ")[1]
-                    extracted_nick = nickname_part.split("!")[0].strip()
-                    if extracted_nick:
-                        self.nickname = extracted_nick
-            except Exception:
-                pass
-            self.auth_event.set()
+
+        elif msg_type == EVENT_DISCONNECTED:
+            print(f"[SYSTEM] Connection lost ({content}). Reconnecting...")
+
+        elif msg_type == EVENT_RECONNECTED:
+            print(f"[SYSTEM] Reconnected. {content}")
 
         elif msg_type == MessageProtocol.TYPE_PUBLIC:
             print(f"{content}")
@@ -119,19 +114,120 @@ class ChatClient:
             print(" | ".join(users))
             print("---------------------------")
 
+        elif msg_type == MessageProtocol.TYPE_SEARCH:
+            results = data.get("results", [])
+            total = data.get("total", 0)
+            if not results:
+                print(f"[SEARCH] No results for '{data.get('query', '')}'.")
+            else:
+                if data.get("page", 1) == 1:
+                    print(f"--- SEARCH RESULTS ({total}) ---")
+                for result in results:
+                    print(f"({result.get('with')}) {result.get('line')}")
+                if data.get("last", True):
+                    print("---------------------------")
+
+        elif msg_type == MessageProtocol.TYPE_FILE_OFFER:
+            print(
+                f"[FILE] {data.get('sender')} wants to send '{data.get('name')}' "
+                f"({data.get('size')} bytes). Use /file accept {data.get('id')} "
+                f"or /file reject {data.get('id')}"
+            )
+
+        elif msg_type == MessageProtocol.TYPE_FILE_END:
+            print(f"[FILE] Received {data.get('size')} bytes into {data.get('path')}")
+
+        elif msg_type == MessageProtocol.TYPE_FILE_CANCEL:
+            print(f"[FILE] Transfer {data.get('id')} cancelled: {data.get('reason')}")
+
+        elif msg_type == MessageProtocol.TYPE_RECEIPT:
+            latency = data.get("latency")
+            timing = f" after {latency * 1000:.1f} ms" if latency is not None else ""
+            print(f"[SYSTEM] [Delivered to {data.get('from')}{timing}]")
+
         elif msg_type == MessageProtocol.TYPE_SYSTEM:
             print(f"[SYSTEM] {content}")
 
         if self.nickname:
             self.re_prompt()
 
-    def send_raw_data(self, data):
+    async def _send_file(self, target, path):
         try:
-            if self.is_connected:
-                self.socket.sendall(data)
-        except Exception as e:
-            print(f"\n[SYSTEM] Failed to send data: {e}")
-            self.disconnect()
+            size = await self.client.send_file(target, path)
+            print(
+                f"\n[FILE] Sent '{os.path.basename(path)}' ({size} bytes) to {target}"
+            )
+        except (FileTransferError, OSError) as e:
+            print(f"\n[FILE] Sending '{path}' failed: {e}")
+        self.re_prompt()
+
+    def handle_file_command(self, text_input):
+        parts = text_input.split(" ", 3)
+        action = parts[1].lower() if len(parts) > 1 else ""
+
+        try:
+            if action == "send" and len(parts) == 4:
+                if not os.path.isfile(parts[3]):
+                    print(f"[SYSTEM] File not found: {parts[3]}")
+                else:
+                    asyncio.run_coroutine_threadsafe(
+                        self._send_file(parts[2], parts[3]), self.loop
+                    )
+            elif action == "accept" and len(parts) >= 3:
+                directory = parts[3] if len(parts) == 4 else "downloads"
+                path = self._call(self.client.accept_file(parts[2], directory))
+                print(f"[FILE] Receiving into {path}")
+            elif action == "reject" and len(parts) == 3:
+                self._call(self.client.reject_file(parts[2]))
+            elif action == "cancel" and len(parts) == 3:
+                self._call(self.client.cancel_file(parts[2]))
+            else:
+                print(
+                    "[SYSTEM] Use: /file send <nick> <path> | /file accept <id> [dir]"
+                    " | /file reject <id> | /file cancel <id>"
+                )
+        except FileTransferError as e:
+            print(f"[SYSTEM] {e}")
+        self.re_prompt()
+
+    async def _send_tracked(self, text):
+        is_private = text.lower().startswith("/msg ")
+        try:
+            ack = await self.client.send_tracked(text, receipt=is_private, wait=True)
+        except asyncio.CancelledError:
+            return
+        if is_private and ack.get("status") == "sent" and not ack.get("duplicate"):
+            target = text.split(" ", 2)[1]
+            print(
+                f"\n[SYSTEM] [Private message sent to {target}] "
+                f"({ack['rtt'] * 1000:.1f} ms)"
+            )
+            self.re_prompt()
+
+    def show_stats(self):
+        stats = self.client.stats()
+        print("--- MESSAGE LATENCY ---")
+        for label, key in (("Server ACK", "ack_rtt"), ("Receipts", "receipt_latency")):
+            values = stats[key]
+            if values.get("count"):
+                print(
+                    f"{label}: {values['count']} msgs, p50 {values['p50_ms']} ms, "
+                    f"p99 {values['p99_ms']} ms, max {values['max_ms']} ms"
+                )
+            else:
+                print(f"{label}: no samples")
+        print(f"Unacknowledged: {stats['unacked']}")
+        print("---------------------------")
+        self.re_prompt()
+
+    def send_line(self, text):
+        if not self.is_connected:
+            return
+        if text.startswith("/") and not text.lower().startswith("/msg "):
+            coro = self.client.send(text)
+        else:
+            coro = self._send_tracked(text)
+        asyncio.run_coroutine_threadsafe(coro, self.loop)
 
     def handle_user_input(self):
         self.re_prompt()
@@ -152,6 +248,14 @@ class ChatClient:
                     parts = text_input[1:].split(" ", 2)
                     command = parts[0].upper()
 
+                    if command == "FILE":
+                        self.handle_file_command(text_input)
+                        continue
+
+                    if command == "STATS":
+                        self.show_stats()
+                        continue
+
                     if command in ["MSG", "FOCUS"]:
                         if len(parts) >= 2:
                             target = parts[1]
@@ -177,23 +281,22 @@ class ChatClient:
                     if not text_input.startswith("/"):
                         final_input = f"/msg {final_target} {text_input}"
 
-                self.send_raw_data(
-                    (final_input + "\n").encode(MessageProtocol.ENCODING)
-                )
+                self.send_line(final_input)
             except Exception as e:
                 print(f"\n[ERROR] Input handling error: {e}")
                 self.disconnect()
                 break
 
     def connect(self):
+        if not self.loop_thread.is_alive():
+            self.loop_thread.start()
+
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            self.client = self._call(self._create_client())
+            auth_prompt = self._call(self.client.open())
             self.is_connected = True
             print(f"[SYSTEM] Connected to server at {self.host}:{self.port}")
-
-            self.listener = MessageListener(self, self.socket)
-            self.listener.start()
+            print(f"\n[AUTH REQUIRED] {auth_prompt}")
             return True
 
         except ConnectionRefusedError:
@@ -203,27 +306,19 @@ class ChatClient:
             print(f"[ERROR] Connection error: {e}")
             return False
 
+    async def _create_client(self):
+        return AsyncChatClient(host=self.host, port=self.port)
+
     def disconnect(self, is_remote=False):
         if self.is_connected:
             self.is_connected = False
 
-            if not is_remote and self.socket:
+            if not is_remote and self.client:
                 try:
-                    self.socket.sendall(
-                        ("/EXIT" + "\n").encode(MessageProtocol.ENCODING)
-                    )
-                    time.sleep(0.2)
+                    self._call(self.client.close(), timeout=2)
                 except Exception:
                     pass
 
-            if self.listener:
-                self.listener.running = False
-
-            try:
-                self.socket.close()
-            except:
-                pass
-
             print("\n[SYSTEM] Connection closed. Application terminating.")
             os._exit(0)
 
@@ -231,6 +326,9 @@ class ChatClient:
         if self.connect():
             if self._handle_auth_prompt():
                 print(
-                    "\n--- You are now in the main chat. Available commands: /list /msg <nick> /exit ---"
+                    "\n--- You are now in the main chat. Available commands: /list /msg <nick> /search <terms> /file /stats /exit ---"
+                )
+                self.listener = asyncio.run_coroutine_threadsafe(
+                    self._listen(), self.loop
                 )
                 self.handle_user_input()
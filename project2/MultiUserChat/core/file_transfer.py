@@ -0,0 +1,258 @@
+import os
+import re
+import time
+import threading
+from .protocol import MessageProtocol
+from .utils import TransferRateLimiter
+
+CHUNK_SIZE = 16 * 1024
+WINDOW = 8
+TRANSFER_ID_RE = re.compile(r"^[0-9a-f]{8,32}$")
+
+
+class FileTransfer:
+    def __init__(self, transfer_id, sender, recipient, name, size):
+        self.transfer_id = transfer_id
+        self.sender = sender
+        self.recipient = recipient
+        self.name = name
+        self.size = size
+        self.accepted = False
+        self.next_seq = 0
+        self.acked = 0
+        self.relayed = 0
+        self.started_at = time.time()
+
+
+class FileTransferRelay:
+    """Relays /file transfers between two online users.
+
+    Chunk payloads are never decoded or JSON-encoded: the sender's raw
+    bytes are forwarded after a small FILE_CHUNK header. The relay checks
+    that the sender stays within the window granted in FILE_ACCEPT, and
+    chunk bytes are throttled by their own TransferRateLimiter instead of
+    the chat RateLimiter.
+    """
+
+    def __init__(
+        self, server_instance, chunk_size=CHUNK_SIZE, window=WINDOW, rate_limiter=None
+    ):
+        self.server = server_instance
+        self.chunk_size = chunk_size
+        self.window = window
+        self.rate_limiter = rate_limiter or TransferRateLimiter()
+        self.transfers = {}
+        self.lock = threading.Lock()
+
+    def _send(self, nickname, msg_type, data):
+        handler = self.server.client_handlers.get(nickname)
+        if handler:
+            handler.send_data(MessageProtocol.encode_message(msg_type, data))
+
+    def _error(self, nickname, message):
+        self.server.send_system_message(nickname, f"File transfer error: {message}")
+
+    def _online_handler(self, nickname):
+        handler = self.server.client_handlers.get(nickname)
+        if handler is None or not getattr(handler, "running", False):
+            return None
+        return handler
+
+    def handle(self, handler, args, payload=None):
+        nickname = handler.nickname
+        parts = args.split(" ", 1)
+        action = parts[0].lower()
+        rest = parts[1] if len(parts) > 1 else ""
+
+        if action == "chunk":
+            self._relay_chunk(nickname, rest, payload)
+        elif action == "ack":
+            self._ack(nickname, rest)
+        elif action == "offer":
+            self._offer(nickname, rest)
+        elif action == "accept":
+            self._accept(nickname, rest.strip())
+        elif action == "end":
+            self._end(nickname, rest.strip())
+        elif action in ("reject", "cancel"):
+            self._cancel(nickname, rest.strip(), f"{action}ed by {nickname}")
+        else:
+            self._error(nickname, "Use: /file send <nickname> <path>")
+
+    def _offer(self, sender, args):
+        parts = args.split(" ", 3)
+        if len(parts) != 4 or not parts[2].isdigit():
+            self._error(sender, "Invalid offer.")
+            return
+
+        transfer_id, recipient, size, name = parts
+        name = os.path.basename(name.replace("\\", "/")).strip()
+        if not TRANSFER_ID_RE.match(transfer_id) or not name:
+            self._error(sender, "Invalid offer.")
+            return
+        if recipient == sender:
+            self._error(sender, "You cannot send a file to yourself.")
+            return
+        if not self._online_handler(recipient):
+            self._error(sender, f"User '{recipient}' is not online.")
+            return
+
+        with self.lock:
+            if transfer_id in self.transfers:
+                self._error(sender, "Duplicate transfer id.")
+                return
+            self.transfers[transfer_id] = FileTransfer(
+                transfer_id, sender, recipient, name, int(size)
+            )
+
+        self._send(
+            recipient,
+            MessageProtocol.TYPE_FILE_OFFER,
+            {"id": transfer_id, "sender": sender, "name": name, "size": int(size)},
+        )
+        self.server.send_system_message(
+            sender, f"[File offer for '{name}' sent to {recipient}]"
+        )
+        self.server.logger.log_event(
+            "FILE", f"{sender} offered '{name}' ({size} bytes) to {recipient}"
+        )
+
+    def _accept(self, recipient, transfer_id):
+        with self.lock:
+            transfer = self.transfers.get(transfer_id)
+            if not transfer or transfer.recipient != recipient or transfer.accepted:
+                transfer = None
+            else:
+                transfer.accepted = True
+
+        if not transfer:
+            self._error(recipient, f"No pending offer '{transfer_id}'.")
+            return
+
+        self._send(
+            transfer.sender,
+            MessageProtocol.TYPE_FILE_ACCEPT,
+            {"id": transfer_id, "chunk_size": self.chunk_size, "window": self.window},
+        )
+
+    def _relay_chunk(self, sender, args, payload):
+        parts = args.split(" ")
+        transfer = self.transfers.get(parts[0]) if parts else None
+        if payload is None:
+            self._error(sender, "Invalid file chunk header.")
+            return
+        if (
+            len(parts) != 3
+            or not transfer
+            or transfer.sender != sender
+            or not transfer.accepted
+        ):
+            self._error(sender, "Unexpected file chunk.")
+            return
+
+        seq = int(parts[1]) if parts[1].isdigit() else -1
+        if seq != transfer.next_seq:
+            self._cancel(sender, transfer.transfer_id, "chunk out of order")
+            return
+        if transfer.next_seq - transfer.acked >= self.window:
+            self._cancel(sender, transfer.transfer_id, "flow control window exceeded")
+            return
+        if transfer.relayed + len(payload) > transfer.size:
+            self._cancel(sender, transfer.transfer_id, "more data than offered")
+            return
+
+        recipient = self._online_handler(transfer.recipient)
+        if not recipient:
+            self._cancel(sender, transfer.transfer_id, "recipient went offline")
+            return
+
+        delay = self.rate_limiter.reserve(sender, len(payload))
+        if delay > 0:
+            time.sleep(delay)
+
+        header = MessageProtocol.encode_message(
+            MessageProtocol.TYPE_FILE_CHUNK,
+            {"id": transfer.transfer_id, "seq": seq, "size": len(payload)},
+        )
+        recipient.send_frames(header, payload)
+        transfer.next_seq += 1
+        transfer.relayed += len(payload)
+
+    def _ack(self, recipient, args):
+        parts = args.split(" ")
+        transfer = self.transfers.get(parts[0]) if parts else None
+        if len(parts) != 2 or not parts[1].isdigit():
+            return
+        if not transfer or transfer.recipient != recipient:
+            return
+
+        seq = int(parts[1])
+        transfer.acked = max(transfer.acked, seq + 1)
+        self._send(
+            transfer.sender,
+            MessageProtocol.TYPE_FILE_ACK,
+            {"id": transfer.transfer_id, "seq": seq},
+        )
+
+    def _end(self, sender, transfer_id):
+        transfer = self.transfers.get(transfer_id)
+        if not transfer or transfer.sender != sender:
+            self._error(sender, f"No active transfer '{transfer_id}'.")
+            return
+        if transfer.relayed != transfer.size:
+            self._cancel(sender, transfer_id, "transfer ended early")
+            return
+
+        with self.lock:
+            self.transfers.pop(transfer_id, None)
+
+        self._send(
+            transfer.recipient,
+            MessageProtocol.TYPE_FILE_END,
+            {"id": transfer_id, "size": transfer.relayed},
+        )
+        elapsed = max(time.time() - transfer.started_at, 0.001)
+        self.server.logger.log_event(
+            "FILE",
+            f"{sender} sent '{transfer.name}' ({transfer.size} bytes) to "
+            f"{transfer.recipient} in {elapsed:.1f}s",
+        )
+
+    def _cancel(self, nickname, transfer_id, reason):
+        with self.lock:
+            transfer = self.transfers.get(transfer_id)
+            if not transfer or nickname not in (transfer.sender, transfer.recipient):
+                transfer = None
+            else:
+                del self.transfers[transfer_id]
+
+        if not transfer:
+            self._error(nickname, f"No active transfer '{transfer_id}'.")
+            return
+
+        for party in (transfer.sender, transfer.recipient):
+            self._send(
+                party,
+                MessageProtocol.TYPE_FILE_CANCEL,
+                {"id": transfer_id, "reason": reason},
+            )
+
+    def drop_user(self, nickname):
+        with self.lock:
+            dropped = [
+                t
+                for t in self.transfers.values()
+                if nickname in (t.sender, t.recipient)
+            ]
+            for transfer in dropped:
+                del self.transfers[transfer.transfer_id]
+
+        for transfer in dropped:
+            other = (
+                transfer.recipient if transfer.sender == nickname else transfer.sender
+            )
+            self._send(
+                other,
+                MessageProtocol.TYPE_FILE_CANCEL,
+                {"id": transfer.transfer_id, "reason": f"{nickname} disconnected"},
+            )
@@ -0,0 +1,199 @@
+import time
+import threading
+from collections import deque
+
+LEVEL_NORMAL = 0
+LEVEL_COALESCE_PRESENCE = 1
+LEVEL_DEFER_NOTIFICATIONS = 2
+LEVEL_SAMPLE_WEB_LOGS = 3
+LEVEL_TIGHTEN_RATE_LIMIT = 4
+
+LEVEL_NAMES = {
+    LEVEL_NORMAL: "normal",
+    LEVEL_COALESCE_PRESENCE: "coalesce presence updates",
+    LEVEL_DEFER_NOTIFICATIONS: "defer system notifications",
+    LEVEL_SAMPLE_WEB_LOGS: "sample web monitor logs",
+    LEVEL_TIGHTEN_RATE_LIMIT: "tighten rate limits",
+}
+
+# A metric at its threshold gives pressure 1.0. The level follows the
+# highest pressure of any metric.
+DEFAULT_THRESHOLDS = {
+    "thread_lag_ms": 50.0,
+    "loop_lag_ms": 100.0,
+    "outbound_backlog_bytes": 4 * 1024 * 1024,
+    "dispatching": 64,
+}
+LEVEL_PRESSURE = [1.0, 1.5, 2.0, 3.0]
+
+MAX_DEFERRED_NOTIFICATIONS = 200
+WEB_LOG_SAMPLE_RATE = 10
+RATE_LIMIT_FACTOR = 0.5
+ALWAYS_PUBLISHED_LEVELS = {"ERROR", "CRITICAL", "SHED", "SERVER"}
+
+
+class LoadShedder(threading.Thread):
+    """Samples server saturation and sheds low-priority work in steps.
+
+    Each level adds to the ones below it. The shedder climbs at most one
+    level per interval and only steps down after recover_intervals quiet
+    intervals in a row, so it does not flap around a threshold.
+    """
+
+    def __init__(
+        self, server_instance, interval=0.5, thresholds=None, recover_intervals=6
+    ):
+        super().__init__(daemon=True, name="LoadShedder")
+        self.server = server_instance
+        self.interval = interval
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.recover_intervals = recover_intervals
+
+        self.level = LEVEL_NORMAL
+        self.metrics = {}
+        self.pressure = 0.0
+        self.quiet = 0
+        self.changed_at = time.time()
+        self.stop_event = threading.Event()
+
+        self.lock = threading.Lock()
+        self.presence_dirty = False
+        self.deferred = deque(maxlen=MAX_DEFERRED_NOTIFICATIONS)
+        self.dropped_notifications = 0
+        self.web_log_counter = 0
+        self.skipped_web_logs = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            expected = time.perf_counter() + self.interval
+            if self.stop_event.wait(self.interval):
+                break
+            lag = max(0.0, time.perf_counter() - expected)
+            try:
+                self._tick(lag)
+            except Exception as e:
+                self.server.logger.log_event("ERROR", f"Load shedder error: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _measure(self, thread_lag):
+        handlers = list(self.server.client_handlers.values())
+        metrics = {
+            "thread_lag_ms": round(thread_lag * 1000, 1),
+            "outbound_backlog_bytes": sum(
+                getattr(handler, "outbound_bytes", 0) for handler in handlers
+            ),
+            "dispatching": sum(
+                1 for handler in handlers if getattr(handler, "dispatching", False)
+            ),
+        }
+        web = self.server.web_server_thread
+        if web is not None and getattr(web, "loop_lag", None) is not None:
+            metrics["loop_lag_ms"] = round(web.loop_lag.last * 1000, 1)
+        return metrics
+
+    def _tick(self, thread_lag):
+        self.metrics = self._measure(thread_lag)
+        self.pressure = max(
+            (
+                value / self.thresholds[name]
+                for name, value in self.metrics.items()
+                if self.thresholds.get(name)
+            ),
+            default=0.0,
+        )
+        target = sum(1 for step in LEVEL_PRESSURE if self.pressure >= step)
+
+        if target > self.level:
+            self.quiet = 0
+            self._set_level(self.level + 1)
+        elif target < self.level:
+            self.quiet += 1
+            if self.quiet >= self.recover_intervals:
+                self.quiet = 0
+                self._set_level(self.level - 1)
+        else:
+            self.quiet = 0
+
+        self._flush_presence()
+        if self.level < LEVEL_DEFER_NOTIFICATIONS:
+            self._flush_notifications()
+
+    def _set_level(self, level):
+        previous, self.level = self.level, level
+        self.changed_at = time.time()
+
+        self.server.rate_limiter.limit_factor = (
+            RATE_LIMIT_FACTOR if level >= LEVEL_TIGHTEN_RATE_LIMIT else 1.0
+        )
+
+        readings = ", ".join(f"{name}={value}" for name, value in self.metrics.items())
+        verb = "raised" if level > previous else "lowered"
+        self.server.logger.log_event(
+            "SHED",
+            f"Load shedding {verb} to level {level} ({LEVEL_NAMES[level]}): "
+            f"pressure {self.pressure:.2f}, {readings}",
+        )
+
+    # Hooks called from ChatServer and Logger.
+
+    def coalesce_presence(self):
+        """True if the caller should skip its list update; one combined
+        update is sent on the next tick instead."""
+        if self.level < LEVEL_COALESCE_PRESENCE:
+            return False
+        self.presence_dirty = True
+        return True
+
+    def defer_notification(self, message, exclude_nick):
+        if self.level < LEVEL_DEFER_NOTIFICATIONS:
+            return False
+        with self.lock:
+            if len(self.deferred) == self.deferred.maxlen:
+                self.dropped_notifications += 1
+            self.deferred.append((message, exclude_nick))
+        return True
+
+    def should_publish(self, level):
+        if (
+            self.level < LEVEL_SAMPLE_WEB_LOGS
+            or level.upper() in ALWAYS_PUBLISHED_LEVELS
+        ):
+            return True
+        self.web_log_counter += 1
+        if self.web_log_counter % WEB_LOG_SAMPLE_RATE == 0:
+            return True
+        self.skipped_web_logs += 1
+        return False
+
+    def drain(self):
+        """Sends anything held back right away, e.g. before a warm restart."""
+        self._flush_presence()
+        self._flush_notifications()
+
+    def _flush_presence(self):
+        if self.presence_dirty:
+            self.presence_dirty = False
+            self.server.send_list_update()
+
+    def _flush_notifications(self):
+        with self.lock:
+            if not self.deferred:
+                return
+            pending = list(self.deferred)
+            self.deferred.clear()
+        self.server.send_notifications(pending)
+
+    def snapshot(self):
+        return {
+            "level": self.level,
+            "name": LEVEL_NAMES[self.level],
+            "pressure": round(self.pressure, 2),
+            "metrics": self.metrics,
+            "thresholds": self.thresholds,
+            "since": self.changed_at,
+            "deferred_notifications": len(self.deferred),
+            "dropped_notifications": self.dropped_notifications,
+            "skipped_web_logs": self.skipped_web_logs,
+        }
@@ -0,0 +1,201 @@
+import mmap
+import os
+import re
+import threading
+from bisect import bisect_left
+
+TIMESTAMP_LEN = 19  # "YYYY-MM-DD HH:MM:SS"
+INDEX_INTERVAL = 64 * 1024
+MAX_PAGE_SIZE = 500
+
+
+class LogIndex:
+    """Sparse timestamp -> byte offset index for the system event log.
+
+    Timestamps are fixed width, so they are compared as plain strings.
+    A checkpoint is recorded every INDEX_INTERVAL bytes and stores the
+    highest timestamp seen so far, which keeps the keys sorted even if
+    the clock steps backwards.
+    """
+
+    def __init__(self, log_file, interval=INDEX_INTERVAL):
+        self.log_file = log_file
+        self.index_file = f"{log_file}.idx"
+        self.interval = interval
+        self.lock = threading.Lock()
+
+        self.keys = []
+        self.offsets = []
+        self.size = 0
+        self.max_ts = ""
+        self.last_checkpoint = None
+
+        self._load()
+
+    def _load(self):
+        log_size = (
+            os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        )
+
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 2 or not parts[1].isdigit():
+                        continue
+                    offset = int(parts[1])
+                    if offset >= log_size or (
+                        self.offsets and offset <= self.offsets[-1]
+                    ):
+                        # Log was truncated or rotated, start over.
+                        self.keys, self.offsets = [], []
+                        break
+                    self.keys.append(parts[0])
+                    self.offsets.append(offset)
+
+        if not self.offsets:
+            open(self.index_file, "w").close()
+
+        self._catch_up(log_size)
+
+    def _catch_up(self, log_size):
+        start = self.offsets[-1] if self.offsets else 0
+        self.max_ts = self.keys[-1] if self.keys else ""
+        self.last_checkpoint = start if self.offsets else None
+        self.size = start
+
+        if log_size <= start:
+            return
+
+        with open(self.log_file, "rb") as f:
+            with mmap.mmap(f.fileno(), log_size, access=mmap.ACCESS_READ) as mm:
+                pos = start
+                while pos < log_size:
+                    end = mm.find(b"\n", pos)
+                    end = log_size if end == -1 else end + 1
+                    timestamp = _line_timestamp(mm, pos)
+                    if timestamp:
+                        self._note_entry(timestamp, pos)
+                    pos = end
+                    self.size = pos
+
+    def _note_entry(self, timestamp, offset):
+        if timestamp > self.max_ts:
+            self.max_ts = timestamp
+
+        if (
+            self.last_checkpoint is None
+            or offset - self.last_checkpoint >= self.interval
+        ):
+            self.keys.append(self.max_ts)
+            self.offsets.append(offset)
+            self.last_checkpoint = offset
+            with open(self.index_file, "a", encoding="utf-8") as f:
+                f.write(f"{self.max_ts}\t{offset}\n")
+
+    def append(self, timestamp, entry_bytes):
+        """Write one entry to the log and update the index. Caller holds the lock."""
+        with open(self.log_file, "ab") as f:
+            f.write(entry_bytes)
+        self._note_entry(timestamp, self.size)
+        self.size += len(entry_bytes)
+
+    def refresh(self):
+        """Indexes entries another process appended, such as the previous
+        server during a warm restart. Caller holds the lock."""
+        log_size = (
+            os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        )
+        if log_size != self.size:
+            self._catch_up(log_size)
+
+    def query(
+        self, start=None, end=None, levels=None, nickname=None, cursor=None, limit=100
+    ):
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        levels = {l.upper() for l in levels} if levels else None
+        nick_re = (
+            re.compile(
+                rb"(?<![\w*])" + re.escape(nickname.encode("utf-8")) + rb"(?![\w])"
+            )
+            if nickname
+            else None
+        )
+        start_key = start.encode("ascii") if start else None
+        end_key = end.encode("ascii") if end else None
+
+        with self.lock:
+            size = self.size
+            keys = self.keys[:]
+            offsets = self.offsets[:]
+
+        if cursor is not None:
+            pos = int(cursor)
+            if not 0 <= pos <= size:
+                raise ValueError("Invalid cursor.")
+        elif start and keys:
+            i = bisect_left(keys, start) - 1
+            pos = offsets[i] if i >= 0 else 0
+        else:
+            pos = 0
+
+        events = []
+        next_cursor = None
+        if size == 0 or pos >= size:
+            return {"events": events, "next_cursor": next_cursor}
+
+        with open(self.log_file, "rb") as f:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                # A cursor always points at the start of a line.
+                if cursor is not None and pos > 0 and mm[pos - 1 : pos] != b"\n":
+                    raise ValueError("Invalid cursor.")
+                while pos < size:
+                    line_end = mm.find(b"\n", pos, size)
+                    line_end = size if line_end == -1 else line_end
+                    line = mm[pos:line_end]
+                    line_start = pos
+                    pos = line_end + 1
+
+                    if len(line) < TIMESTAMP_LEN + 2 or line[:1] != b"[":
+                        continue
+                    timestamp = line[1 : TIMESTAMP_LEN + 1]
+                    if start_key and timestamp < start_key:
+                        continue
+                    if end_key and timestamp > end_key:
+                        break
+
+                    level_end = line.find(b"]:", TIMESTAMP_LEN + 3)
+                    if level_end == -1:
+                        continue
+                    level = line[TIMESTAMP_LEN + 4 : level_end].decode(
+                        "utf-8", "replace"
+                    )
+                    if levels and level not in levels:
+                        continue
+                    message = line[level_end + 2 :].strip()
+                    if nick_re and not nick_re.search(message):
+                        continue
+
+                    if len(events) == limit:
+                        next_cursor = line_start
+                        break
+
+                    events.append(
+                        {
+                            "timestamp": timestamp.decode("ascii"),
+                            "level": level,
+                            "message": message.decode("utf-8", "replace"),
+                            "offset": line_start,
+                        }
+                    )
+
+        return {"events": events, "next_cursor": next_cursor}
+
+
+def _line_timestamp(mm, pos):
+    if mm[pos : pos + 1] != b"[":
+        return None
+    timestamp = mm[pos + 1 : pos + 1 + TIMESTAMP_LEN]
+    if len(timestamp) != TIMESTAMP_LEN:
+        return None
+    return timestamp.decode("ascii", "replace")
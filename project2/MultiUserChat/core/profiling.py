@@ -0,0 +1,194 @@
+import sys
+import time
+import threading
+
+MAX_PROFILE_SECONDS = 300
+DEFAULT_SAMPLE_INTERVAL = 0.005
+MIN_SAMPLE_INTERVAL = 0.001
+
+
+class SamplingProfiler:
+    """Periodically samples the stacks of every thread.
+
+    Nothing runs while the profiler is idle. The last finished profile is
+    kept in collapsed-stack format ("frame;frame;frame count") so it can
+    be fed straight into flamegraph tools.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.done_event = threading.Event()
+        self.done_event.set()
+        self.counts = {}
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self.last_profile = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds, interval=DEFAULT_SAMPLE_INTERVAL):
+        with self.lock:
+            if self.running:
+                return False
+            seconds = max(0.1, min(float(seconds), MAX_PROFILE_SECONDS))
+            interval = max(MIN_SAMPLE_INTERVAL, float(interval))
+            self.counts = {}
+            self.samples = 0
+            self.started_at = time.time()
+            self.stop_event.clear()
+            self.done_event.clear()
+            self.thread = threading.Thread(
+                target=self._run, args=(seconds, interval), daemon=True
+            )
+            self.thread.start()
+            return True
+
+    def stop(self):
+        self.stop_event.set()
+        self.done_event.wait()
+        return self.summary()
+
+    def wait(self, timeout=None):
+        return self.done_event.wait(timeout)
+
+    def _run(self, seconds, interval):
+        own_id = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + seconds
+        try:
+            while not self.stop_event.is_set() and time.perf_counter() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = self._fold(frame, names.get(thread_id, str(thread_id)))
+                    self.counts[stack] = self.counts.get(stack, 0) + 1
+                self.samples += 1
+                self.stop_event.wait(interval)
+        finally:
+            self.duration = time.perf_counter() - started
+            self.last_profile = "".join(
+                f"{stack} {count}\n"
+                for stack, count in sorted(
+                    self.counts.items(), key=lambda item: item[1], reverse=True
+                )
+            )
+            self.done_event.set()
+
+    @staticmethod
+    def _fold(frame, thread_name):
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            file_name = code.co_filename.replace("\\", "/").rsplit("/", 1)[-1]
+            frames.append(f"{code.co_name} ({file_name}:{frame.f_lineno})")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(reversed(frames))
+
+    def summary(self):
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "stacks": len(self.counts),
+            "duration": round(self.duration, 3),
+            "started_at": self.started_at,
+        }
+
+
+class LatencyHistogram:
+    """Log2-bucketed latency histogram per command type."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def record(self, command, seconds):
+        micros = int(seconds * 1_000_000)
+        bucket = micros.bit_length()
+        with self.lock:
+            stats = self.commands.get(command)
+            if stats is None:
+                stats = self.commands[command] = {
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "buckets": {},
+                }
+            stats["count"] += 1
+            stats["total"] += seconds
+            if seconds > stats["max"]:
+                stats["max"] = seconds
+            stats["buckets"][bucket] = stats["buckets"].get(bucket, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.commands = {}
+
+    def snapshot(self):
+        with self.lock:
+            commands = {
+                name: dict(stats, buckets=dict(stats["buckets"]))
+                for name, stats in self.commands.items()
+            }
+
+        report = {}
+        for name, stats in commands.items():
+            buckets = sorted(stats["buckets"].items())
+            report[name] = {
+                "count": stats["count"],
+                "mean_ms": round(stats["total"] / stats["count"] * 1000, 3),
+                "max_ms": round(stats["max"] * 1000, 3),
+                "p50_ms": self._percentile(buckets, stats["count"], 0.50),
+                "p99_ms": self._percentile(buckets, stats["count"], 0.99),
+                "buckets": {
+                    f"<{(1 << bucket) / 1000:g}ms": count for bucket, count in buckets
+                },
+            }
+        return report
+
+    @staticmethod
+    def _percentile(buckets, count, fraction):
+        seen = 0
+        for bucket, bucket_count in buckets:
+            seen += bucket_count
+            if seen >= count * fraction:
+                return (1 << bucket) / 1000
+        return None
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed sleep."""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self.count = 0
+
+    async def run(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.total += lag
+            self.count += 1
+
+    def snapshot(self):
+        return {
+            "last_ms": round(self.last * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "samples": self.count,
+        }
@@ -1,25 +1,52 @@
+import re
 import json
 
 
 class MessageProtocol:
     MSG_SEPARATOR = "|"
+    FRAME_DELIMITER = b"\n"
+    MAX_FRAME_SIZE = 64 * 1024
+    MAX_CHUNK_SIZE = 64 * 1024
     ENCODING = "utf-8"
 
     TYPE_AUTH_REQ = "AUTH_REQ"
     TYPE_AUTH_FAIL = "AUTH_FAIL"
     TYPE_AUTH_SUCCESS = "AUTH_SUCCESS"
+    TYPE_SESSION = "SESSION"
     TYPE_PUBLIC = "PUBLIC"
     TYPE_PRIVATE = "PRIVATE"
     TYPE_SYSTEM = "SYSTEM"
     TYPE_LIST = "LIST"
     TYPE_LIST_REQ = "LIST_REQ"
+    TYPE_SEARCH = "SEARCH"
+    TYPE_SEARCH_REQ = "SEARCH_REQ"
+    TYPE_FILE_REQ = "FILE_REQ"
+    TYPE_FILE_OFFER = "FILE_OFFER"
+    TYPE_FILE_ACCEPT = "FILE_ACCEPT"
+    TYPE_FILE_CHUNK = "FILE_CHUNK"
+    TYPE_FILE_ACK = "FILE_ACK"
+    TYPE_FILE_END = "FILE_END"
+    TYPE_FILE_CANCEL = "FILE_CANCEL"
+    TYPE_ACK = "ACK"
+    TYPE_RECEIPT = "RECEIPT"
+
+    # Chunk headers: clients send FILE_CHUNK_CMD, the server relays the
+    # payload behind a FILE_CHUNK_HEADER message.
+    FILE_CHUNK_CMD = b"/file chunk "
+    FILE_CHUNK_HEADER = b"FILE_CHUNK|"
+
+    # "/mid <id>[!] <line>" tags a PUBLIC or PRIVATE line with a client
+    # message id; "!" asks the recipient of a private message for a receipt.
+    MESSAGE_ID_CMD = "/mid "
+    MESSAGE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
 
     CMD_EXIT = "EXIT"
+    CMD_RESUME = "*RESUME"
 
     @staticmethod
     def encode_message(msg_type, data):
         data_json = json.dumps(data)
-        return f"{msg_type}{MessageProtocol.MSG_SEPARATOR}{data_json}".encode(
+        return f"{msg_type}{MessageProtocol.MSG_SEPARATOR}{data_json}\n".encode(
             MessageProtocol.ENCODING
         )
 
@@ -37,9 +64,58 @@ class MessageProtocol:
 
             return msg_type, data_dict
 
-        except (ValueError, IndexError, json.JSONDecodeError, UnicodeDecodeError):
+        except (
+            ValueError,
+            IndexError,
+            json.JSONDecodeError,
+            UnicodeDecodeError,
+            RecursionError,
+        ):
             return None, None
 
+    @staticmethod
+    def encode_chunk_header(transfer_id, seq, size):
+        return f"/file chunk {transfer_id} {seq} {size}\n".encode(
+            MessageProtocol.ENCODING
+        )
+
+    @staticmethod
+    def payload_length(frame, prefix=FILE_CHUNK_CMD):
+        """Size of the raw payload that follows a chunk header frame, or None.
+        prefix says which kind of header to look for. Raises ValueError for
+        a header with a missing or out of range size."""
+        if not frame.startswith(prefix):
+            return None
+        if prefix == MessageProtocol.FILE_CHUNK_HEADER:
+            try:
+                header = json.loads(frame[len(prefix) :])
+            except RecursionError:
+                raise ValueError("Invalid file chunk header.")
+            size = header.get("size", -1) if isinstance(header, dict) else -1
+        else:
+            parts = frame.split(b" ")
+            size = int(parts[4]) if len(parts) == 5 and parts[4].isdigit() else -1
+
+        if not isinstance(size, int) or not 0 <= size <= MessageProtocol.MAX_CHUNK_SIZE:
+            raise ValueError("Invalid file chunk size.")
+        return size
+
+    @staticmethod
+    def split_message_id(text_input):
+        """Returns (msg_id, wants_receipt, line) for a /mid line, or
+        (None, False, text_input) for anything else."""
+        if not text_input.startswith(MessageProtocol.MESSAGE_ID_CMD):
+            return None, False, text_input
+
+        parts = text_input.split(" ", 2)
+        msg_id = parts[1] if len(parts) > 1 else ""
+        wants_receipt = msg_id.endswith("!")
+        if wants_receipt:
+            msg_id = msg_id[:-1]
+        if len(parts) != 3 or not MessageProtocol.MESSAGE_ID_RE.match(msg_id):
+            return None, False, text_input
+        return msg_id, wants_receipt, parts[2]
+
     @staticmethod
     def parse_client_command(text_input):
         text_input = text_input.strip()
@@ -59,7 +135,79 @@ class MessageProtocol:
         if command == "LIST":
             return MessageProtocol.TYPE_LIST_REQ, None, None
 
+        if command == "SEARCH":
+            query = " ".join(parts[1:]).strip()
+            return MessageProtocol.TYPE_SEARCH_REQ, None, query
+
+        if command == "FILE":
+            args = " ".join(parts[1:]).strip()
+            return MessageProtocol.TYPE_FILE_REQ, None, args
+
+        if command == "RECEIPT" and len(parts) == 3:
+            return MessageProtocol.TYPE_RECEIPT, parts[1], parts[2].strip()
+
         if command == "EXIT":
             return MessageProtocol.CMD_EXIT, None, None
 
         return "UNKNOWN_CMD", None, None
+
+
+class FrameBuffer:
+    """Reassembles newline-delimited frames from a byte stream.
+
+    feed() returns (frame, payload) pairs. payload is None except for file
+    chunk headers, which are followed by that many raw bytes. chunk_prefix
+    is the header the other side sends: FILE_CHUNK_CMD on the server,
+    FILE_CHUNK_HEADER on a client. A chunk header with a bad size raises
+    ValueError, since the bytes after it can't be told apart from frames.
+    """
+
+    def __init__(
+        self,
+        max_frame_size=MessageProtocol.MAX_FRAME_SIZE,
+        chunk_prefix=MessageProtocol.FILE_CHUNK_CMD,
+    ):
+        self.max_frame_size = max_frame_size
+        self.chunk_prefix = chunk_prefix
+        self.buffer = bytearray()
+        self.chunk_header = None
+        self.chunk_size = 0
+        # Bytes at the start of the buffer already known to hold no delimiter.
+        self.scanned = 0
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        start = 0
+        while True:
+            if self.chunk_header is not None:
+                if len(self.buffer) - start < self.chunk_size:
+                    break
+                end = start + self.chunk_size
+                frames.append((self.chunk_header, bytes(self.buffer[start:end])))
+                self.chunk_header = None
+                start = end
+                continue
+
+            end = self.buffer.find(
+                MessageProtocol.FRAME_DELIMITER, max(start, self.scanned)
+            )
+            if end == -1:
+                break
+            frame = bytes(self.buffer[start:end])
+            start = end + 1
+
+            size = MessageProtocol.payload_length(frame, self.chunk_prefix)
+            if size is None:
+                frames.append((frame, None))
+            else:
+                self.chunk_header = frame
+                self.chunk_size = size
+        del self.buffer[:start]
+        self.scanned = len(self.buffer) if self.chunk_header is None else 0
+
+        if self.chunk_header is None and len(self.buffer) > self.max_frame_size:
+            self.buffer.clear()
+            self.scanned = 0
+            raise ValueError("Frame exceeds maximum size.")
+        return frames
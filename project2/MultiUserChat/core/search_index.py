@@ -0,0 +1,217 @@
+import os
+import re
+import queue
+import threading
+from bisect import bisect_left
+
+TOKEN_RE = re.compile(r"\w+")
+PAGE_SIZE = 20
+MAX_RESULTS = 200
+
+
+def tokenize(text):
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+class UserIndex:
+    def __init__(self):
+        self.records = []
+        self.postings = {}
+        self.high_water = {}
+
+    def add(self, partner, day, offset, length, tokens):
+        key = (partner, day)
+        if offset < self.high_water.get(key, 0):
+            return False
+        self.high_water[key] = offset + length
+
+        record_id = len(self.records)
+        self.records.append((partner, day, offset, length))
+        for token in tokens:
+            self.postings.setdefault(token, []).append(record_id)
+        return True
+
+    def match(self, tokens, partner=None):
+        lists = [self.postings.get(token) for token in tokens]
+        if not lists or not all(lists):
+            return []
+        lists.sort(key=len)
+
+        matches = []
+        for record_id in lists[0]:
+            if partner and self.records[record_id][0] != partner:
+                continue
+            for other in lists[1:]:
+                i = bisect_left(other, record_id)
+                if i == len(other) or other[i] != record_id:
+                    break
+            else:
+                matches.append(record_id)
+        return matches
+
+
+class SearchIndex:
+    """Per-user inverted index over private conversation logs.
+
+    Logger.log_private only queues new records; a background thread
+    tokenizes them and appends them to log/search_index/<nick>.idx. A
+    user's index is loaded into memory on their first search and caught
+    up with any log lines that were never indexed.
+    """
+
+    def __init__(self, user_data_path, index_path):
+        self.user_data_path = user_data_path
+        self.index_path = index_path
+        os.makedirs(self.index_path, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.loaded = {}
+        self.pending = queue.Queue()
+
+        self.worker = threading.Thread(target=self._run_worker, daemon=True)
+        self.worker.start()
+
+    def _index_file(self, owner):
+        return os.path.join(self.index_path, f"{owner}.idx")
+
+    def add_record(self, owner, partner, day, offset, length, content):
+        self.pending.put((owner, partner, day, offset, length, content))
+
+    def _run_worker(self):
+        while True:
+            batch = [self.pending.get()]
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._index_batch(batch)
+            except Exception as e:
+                print(f"[FATAL LOG ERROR] Failed to update search index: {e}")
+
+    def _index_batch(self, batch):
+        by_owner = {}
+        for owner, partner, day, offset, length, content in batch:
+            by_owner.setdefault(owner, []).append(
+                (partner, day, offset, length, tokenize(content))
+            )
+
+        with self.lock:
+            for owner, records in by_owner.items():
+                user_index = self.loaded.get(owner)
+                if user_index:
+                    records = [r for r in records if user_index.add(*r)]
+                self._append_records(owner, records)
+
+    def _append_records(self, owner, records):
+        if not records:
+            return
+        lines = [
+            f"{partner}\t{day}\t{offset}\t{length}\t{' '.join(sorted(tokens))}\n"
+            for partner, day, offset, length, tokens in records
+        ]
+        with open(self._index_file(owner), "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def _load_user(self, owner):
+        user_index = UserIndex()
+
+        index_file = self._index_file(owner)
+        if os.path.exists(index_file):
+            with open(index_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 5:
+                        continue
+                    partner, day, offset, length, tokens = parts
+                    user_index.add(
+                        partner, day, int(offset), int(length), tokens.split()
+                    )
+
+        self._append_records(owner, self._catch_up(owner, user_index))
+        self.loaded[owner] = user_index
+        return user_index
+
+    def _catch_up(self, owner, user_index):
+        owner_dir = os.path.join(self.user_data_path, owner)
+        if not os.path.isdir(owner_dir):
+            return []
+
+        conversations = []
+        for partner in os.listdir(owner_dir):
+            chat_dir = os.path.join(owner_dir, partner)
+            if not os.path.isdir(chat_dir):
+                continue
+            for file_name in os.listdir(chat_dir):
+                if file_name.endswith(".log"):
+                    conversations.append((file_name[:-4], partner))
+
+        new_records = []
+        for day, partner in sorted(conversations):
+            file_path = os.path.join(owner_dir, partner, f"{day}.log")
+            start = user_index.high_water.get((partner, day), 0)
+            if os.path.getsize(file_path) <= start:
+                continue
+
+            with open(file_path, "rb") as f:
+                f.seek(start)
+                offset = start
+                for raw_line in f:
+                    length = len(raw_line)
+                    line = raw_line.decode("utf-8", "replace")
+                    content = line.split(">: ", 1)[1] if ">: " in line else line
+                    record = (partner, day, offset, length, tokenize(content))
+                    if raw_line.endswith(b"\n") and user_index.add(*record):
+                        new_records.append(record)
+                    offset += length
+
+        return new_records
+
+    def search(self, owner, query, page_size=PAGE_SIZE, max_results=MAX_RESULTS):
+        """Yield pages of matching log lines, newest first."""
+        partner = None
+        terms = []
+        for term in query.split():
+            if term.lower().startswith("with:"):
+                partner = term[5:] or None
+            else:
+                terms.append(term)
+
+        tokens = set()
+        for term in terms:
+            tokens |= tokenize(term)
+        if not tokens:
+            return
+
+        with self.lock:
+            user_index = self.loaded.get(owner) or self._load_user(owner)
+            matches = user_index.match(tokens, partner)
+            records = [user_index.records[i] for i in matches]
+
+        records.sort(key=lambda r: (r[1], r[2]), reverse=True)
+        records = records[:max_results]
+
+        for start in range(0, len(records), page_size):
+            page = records[start : start + page_size]
+            yield start // page_size + 1, len(records), self._read_lines(owner, page)
+
+    def _read_lines(self, owner, records):
+        results = []
+        handles = {}
+        try:
+            for partner, day, offset, length in records:
+                f = handles.get((partner, day))
+                if f is None:
+                    file_path = os.path.join(
+                        self.user_data_path, owner, partner, f"{day}.log"
+                    )
+                    f = handles[(partner, day)] = open(file_path, "rb")
+                f.seek(offset)
+                line = f.read(length).decode("utf-8", "replace").rstrip("\r\n")
+                results.append({"with": partner, "line": line})
+        finally:
+            for f in handles.values():
+                f.close()
+        return results
@@ -2,115 +2,71 @@ import threading
 import socket
 import time
 import os
-import json
-import asyncio
-from websockets.server import serve as serve_websocket
-from http.server import SimpleHTTPRequestHandler, HTTPServer
-from .protocol import MessageProtocol
-from .utils import Logger, UserDatabase, RateLimiter
+import secrets
+from collections import deque
+from .protocol import MessageProtocol, FrameBuffer
+from .utils import (
+    Logger,
+    UserDatabase,
+    RateLimiter,
+    SessionTokens,
+    MessageIdCache,
+    PendingReceipts,
+)
+from .profiling import SamplingProfiler, LatencyHistogram
+from .file_transfer import FileTransferRelay
+from .load_shedding import LoadShedder, LEVEL_NORMAL
+from .warm_restart import WarmRestart
+from .traffic_capture import TrafficCapture
+
+MAX_MISSED_MESSAGES = 500
+MAX_IOV = 512
+OUTBOUND_HIGH_WATER = 1024 * 1024
+
+
+def send_buffers(sock, buffers):
+    """Writes buffers with as few syscalls as possible. sendmsg gathers
+    the frames straight from the original bytes objects, so a broadcast
+    frame shared by every recipient is never copied or joined."""
+    if len(buffers) == 1 or not hasattr(sock, "sendmsg"):
+        for data in buffers:
+            sock.sendall(data)
+        return
+
+    views = [memoryview(data) for data in buffers if data]
+    start = 0
+    while start < len(views):
+        sent = sock.sendmsg(views[start : start + MAX_IOV])
+        while sent:
+            size = len(views[start])
+            if sent >= size:
+                sent -= size
+                start += 1
+            else:
+                views[start] = views[start][sent:]
+                sent = 0
+
+
+class DetachedSession:
+    """Stands in for a dropped connection during the resume grace period
+    and queues every frame that would have been sent to it."""
+
+    def __init__(self, nickname, session_id):
+        self.nickname = nickname
+        self.session_id = session_id
+        self.missed = deque(maxlen=MAX_MISSED_MESSAGES)
+        self.timer = None
+        self.expires_at = None
 
+    def send_data(self, data):
+        self.missed.append(data)
 
-class WebServerThread(threading.Thread):
-    def __init__(self, server_instance, http_port, websocket_port):
-        super().__init__()
-        self.server_instance = server_instance
-        self.http_port = http_port
-        self.websocket_port = websocket_port
-        self.running = True
-        self.httpd = None
-        self.websocket_server = None
-        self.connected_websockets = set()
-        self.loop = None
-
-    def _start_http_server(self):
-        try:
-            static_dir = os.path.join(
-                os.path.dirname(os.path.abspath(__file__)), "..", "static"
-            )
-
-            original_dir = os.getcwd()
-            os.chdir(static_dir)
-
-            handler = SimpleHTTPRequestHandler
-            self.httpd = HTTPServer(("", self.http_port), handler)
-            self.server_instance.logger.log_event(
-                "WEB", f"HTTP Server listening on port {self.http_port}"
-            )
-
-            self.httpd.serve_forever()
-
-        except Exception as e:
-            self.server_instance.logger.log_event(
-                "CRITICAL_HTTP", f"HTTP Server error: {e}"
-            )
-        finally:
-            try:
-                os.chdir(original_dir)
-            except:
-                pass
-
-    async def _handle_websocket_connection(self, websocket):
-        self.connected_websockets.add(websocket)
-        self.server_instance.logger.log_event(
-            "WEBSOCKET", f"New connection from {websocket.remote_address}"
-        )
-
-        try:
-            password = await websocket.recv()
-            if password != self.server_instance.admin_password:
-                await websocket.send("Authentication Failed. Connection closed.")
-                self.server_instance.logger.log_event(
-                    "WEBSOCKET_FAIL",
-                    f"Failed authentication attempt from {websocket.remote_address}",
-                )
-                await websocket.close()
-                return
-
-            await websocket.send("Authentication Success. Receiving live logs.")
-            self.server_instance.logger.log_event(
-                "WEBSOCKET_AUTH", f"Client authenticated successfully."
-            )
-
-            await websocket.wait_closed()
-
-        except Exception:
-            pass
-        finally:
-            self.connected_websockets.remove(websocket)
-            self.server_instance.logger.log_event("WEBSOCKET", f"Connection closed.")
-
-    async def _start_websocket_server(self):
-        self.websocket_server = serve_websocket(
-            self._handle_websocket_connection, "0.0.0.0", self.websocket_port
-        )
-        async with self.websocket_server as server:
-            await server.serve_forever()
-
-    def run(self):
-        self.logger = self.server_instance.logger
-
-        http_thread = threading.Thread(target=self._start_http_server)
-        http_thread.daemon = True
-        http_thread.start()
-
-        try:
-            self.loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.loop)
-            self.logger.log_event(
-                "WEB", f"WebSocket Server starting on port {self.websocket_port}"
-            )
-
-            self.loop.run_until_complete(self._start_websocket_server())
-
-        except Exception as e:
-            self.logger.log_event("CRITICAL_WEB", f"Async Loop error: {e}")
+    def send_frames(self, *buffers):
+        self.missed.extend(buffers)
 
-    def stop(self):
-        self.running = False
-        if self.httpd:
-            self.httpd.shutdown()
-        if self.loop:
-            self.loop.stop()
+    def close_connection(self):
+        if self.timer:
+            self.timer.cancel()
 
 
 class ClientHandler(threading.Thread):
@@ -122,25 +78,131 @@ class ClientHandler(threading.Thread):
         self.nickname = None
         self.logger = self.server.logger
         self.running = True
+        self.closed = False
+        self.clean_exit = False
+        self.superseded = False
+        self.frame_buffer = FrameBuffer()
+        self.pending_frames = []
+        self.outbound = []
+        self.outbound_bytes = 0
+        self.outbound_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flushing = False
+        self.dispatching = False
+        self.session_id = None
+        self.resumed_session = None
+        self.token_issued_at = 0
+        # Set when the connection moves to another process on a warm restart.
+        self.adopted = False
+        self.handed_off = False
+        self.capture_id = None
+
+    def _read_frames(self):
+        if self.pending_frames:
+            frames, self.pending_frames = self.pending_frames, []
+            return frames
+
+        warm_restart = self.server.warm_restart
+        if warm_restart.pending and warm_restart.park(self):
+            return None
+
+        try:
+            data = self.socket.recv(4096)
+        except BlockingIOError:
+            # SO_RCVTIMEO ran out; only set while warm restart is enabled.
+            return []
+        if not data:
+            return None
+        try:
+            frames = self.frame_buffer.feed(data)
+        except ValueError as e:
+            # After an oversized frame or a bad chunk header the rest of the
+            # stream can't be framed; file bytes must not run as commands.
+            self.logger.log_event(
+                "WARN", f"Closing connection from {self.address[0]}: {e}"
+            )
+            return None
+        capture = self.server.capture
+        # Frames read during login are recorded one at a time, redacted.
+        if capture is not None and frames and self.nickname is not None:
+            capture.record(self, frames)
+        return frames
+
+    def _next_frame(self):
+        while not self.pending_frames:
+            frames = self._read_frames()
+            if frames is None:
+                return None
+            self.pending_frames = frames
+        return self.pending_frames.pop(0)
 
     def send_data(self, data):
+        self.send_frames(data)
+
+    def send_frames(self, *buffers):
+        """Queues frames for this connection. Whichever thread finds no
+        flush in progress becomes the flusher and writes its frames plus
+        everything other threads queue meanwhile, one vectored send per
+        batch."""
+        with self.outbound_lock:
+            if self.closed:
+                return
+            if self.flushing:
+                self.outbound.extend(buffers)
+                self.outbound_bytes += sum(map(len, buffers))
+                if self.outbound_bytes <= OUTBOUND_HIGH_WATER:
+                    return
+                backlogged = True
+            else:
+                self.flushing = True
+                backlogged = False
+
+        if backlogged:
+            # Slow reader: wait for the current flusher to drain the queue.
+            with self.flush_lock:
+                return
+
+        self._flush(buffers)
+
+    def _flush(self, batch):
         try:
-            self.socket.sendall(data)
+            with self.flush_lock:
+                while batch:
+                    send_buffers(self.socket, batch)
+                    with self.outbound_lock:
+                        batch = self.outbound
+                        self.outbound = []
+                        self.outbound_bytes = 0
+                        if not batch:
+                            self.flushing = False
         except Exception as e:
+            # flushing stays set so no other thread writes to the dead socket.
+            with self.outbound_lock:
+                self.outbound = []
+                self.outbound_bytes = 0
             self.logger.log_event(
                 "ERROR", f"Failed to send data to {self.nickname}: {e}"
             )
             self.close_connection()
 
     def close_connection(self):
-        if self.running:
+        if not self.closed:
+            self.closed = True
             self.running = False
             try:
                 self.socket.shutdown(socket.SHUT_RDWR)
             except:
                 pass
             self.socket.close()
-            self.server.remove_client(self.nickname)
+            self.server.connections.discard(self)
+            if self.server.capture is not None:
+                self.server.capture.close_connection(self)
+            if not self.superseded:
+                self.server.release_client(self)
+
+    def issue_resume_token(self):
+        self.token_issued_at = time.time()
+        return self.server.session_tokens.issue(self.nickname, self.session_id)
 
     def _handle_initial_auth(self):
         auth_req_msg = MessageProtocol.encode_message(
@@ -149,18 +211,42 @@ class ClientHandler(threading.Thread):
                 "content": "Welcome! Please register or login. Format: <nickname> <password>"
             },
         )
-        self.send_data(auth_req_msg)
+        if not self.adopted:
+            self.send_data(auth_req_msg)
 
         while self.running and not self.nickname:
             try:
-                raw_data = self.socket.recv(1024)
-                if not raw_data:
+                frame = self._next_frame()
+                if frame is None:
                     break
+                if self.server.capture is not None:
+                    self.server.capture.record_login(self, frame)
+
+                raw_data, _ = frame
 
                 auth_str = raw_data.decode(MessageProtocol.ENCODING).strip()
                 if not auth_str:
                     continue
 
+                if auth_str.startswith(MessageProtocol.CMD_RESUME + " "):
+                    token = auth_str[len(MessageProtocol.CMD_RESUME) + 1 :]
+                    session = self.server.take_over_session(token)
+                    if session:
+                        self.nickname = session.nickname
+                        self.resumed_session = session
+                        self.logger.log_event(
+                            "RESUME",
+                            f"User {self.nickname} resumed session from {self.address[0]}",
+                        )
+                        return True
+
+                    error_msg = MessageProtocol.encode_message(
+                        MessageProtocol.TYPE_AUTH_FAIL,
+                        {"content": "Session could not be resumed. Please log in."},
+                    )
+                    self.send_data(error_msg)
+                    continue
+
                 parts = auth_str.split(" ", 1)
 
                 if len(parts) != 2:
@@ -214,67 +300,150 @@ class ClientHandler(threading.Thread):
 
         return False
 
-    def run(self):
-        self.logger.log_event(
-            "CONNECT", f"Attempting connection from {self.address[0]}:{self.address[1]}"
-        )
-
+    def _log_in(self):
         if not self._handle_initial_auth():
-            self.close_connection()
-            return
+            return False
+        if self.server.capture is not None and self.pending_frames:
+            # Commands the client pipelined behind its login.
+            self.server.capture.record(self, self.pending_frames)
 
-        self.server.add_client(self.nickname, self.socket, self.address, self)
+        self.session_id = secrets.token_hex(8)
 
-        welcome_msg = MessageProtocol.encode_message(
-            MessageProtocol.TYPE_AUTH_SUCCESS,
-            {"content": f"Welcome back, {self.nickname}! You are now connected."},
-        )
-        self.send_data(welcome_msg)
+        if self.resumed_session:
+            self.server.resume_client(self, self.resumed_session)
+        else:
+            self.server.add_client(self.nickname, self.socket, self.address, self)
+
+            welcome_msg = MessageProtocol.encode_message(
+                MessageProtocol.TYPE_AUTH_SUCCESS,
+                {
+                    "content": f"Welcome back, {self.nickname}! You are now connected.",
+                    "resume_token": self.issue_resume_token(),
+                },
+            )
+            self.send_data(welcome_msg)
 
-        self.server.broadcast_notification(
-            f"User {self.nickname} has joined the chat.", exclude_nick=self.nickname
-        )
+            self.server.broadcast_notification(
+                f"User {self.nickname} has joined the chat.", exclude_nick=self.nickname
+            )
+        return True
+
+    def run(self):
+        if not self.adopted:
+            self.logger.log_event(
+                "CONNECT",
+                f"Attempting connection from {self.address[0]}:{self.address[1]}",
+            )
+
+        # Connections adopted on a warm restart may already be logged in.
+        if not self.nickname and not self._log_in():
+            self.close_connection()
+            return
 
         while self.running:
             try:
-                data = self.socket.recv(4096)
-                if not data:
+                frames = self._read_frames()
+                if frames is None:
                     break
 
-                messages = data.decode(MessageProtocol.ENCODING).split("\n")
-
-                for msg_str in messages:
+                self.dispatching = True
+                for frame, payload in frames:
+                    msg_str = frame.decode(MessageProtocol.ENCODING, "replace")
                     if msg_str.strip():
-                        if self.server.rate_limiter.check_and_update(self.nickname):
+                        started = time.perf_counter()
+                        msg_id, wants_receipt, msg_str = (
+                            MessageProtocol.split_message_id(msg_str)
+                        )
+                        msg_type, target, content = (
+                            MessageProtocol.parse_client_command(msg_str)
+                        )
+                        if msg_type not in (
+                            MessageProtocol.TYPE_PUBLIC,
+                            MessageProtocol.TYPE_PRIVATE,
+                        ):
+                            msg_id = None
+
+                        if msg_id:
+                            ack = self.server.message_ids.get(self.nickname, msg_id)
+                            if ack:
+                                # A retry of a message that already went out.
+                                self.send_data(
+                                    MessageProtocol.encode_message(
+                                        MessageProtocol.TYPE_ACK,
+                                        dict(ack, duplicate=True),
+                                    )
+                                )
+                                continue
+
+                        # File transfers have their own byte-rate limiter. A
+                        # receipt the server asked for is free, so receiving
+                        # messages doesn't use up the recipient's own budget;
+                        # any other receipt is dropped but still counted.
+                        if msg_type == MessageProtocol.TYPE_RECEIPT:
+                            exempt = self.server.relay_receipt(
+                                self.nickname, target, content
+                            )
+                        else:
+                            exempt = msg_type == MessageProtocol.TYPE_FILE_REQ
+                        if not exempt and self.server.rate_limiter.check_and_update(
+                            self.nickname
+                        ):
                             self.server.send_system_message(
                                 self.nickname,
                                 "WARNING: Message rate limit exceeded. Please slow down.",
                             )
+                            if msg_id:
+                                self.server.acknowledge(
+                                    self, msg_id, "rejected", "rate limited"
+                                )
                             continue
 
-                        msg_type, target, content = (
-                            MessageProtocol.parse_client_command(msg_str)
-                        )
+                        if msg_type == MessageProtocol.TYPE_FILE_REQ:
+                            self.server.file_relay.handle(self, content, payload)
+
+                        elif msg_type == MessageProtocol.TYPE_RECEIPT:
+                            pass  # Relayed or dropped above.
 
-                        if msg_type == MessageProtocol.TYPE_PUBLIC:
-                            self.server.broadcast_public(self.nickname, content)
+                        elif msg_type == MessageProtocol.TYPE_PUBLIC:
+                            self.server.broadcast_public(self.nickname, content, msg_id)
                             self.logger.log_public(self.nickname, content)
+                            if msg_id:
+                                self.server.acknowledge(self, msg_id, "ok")
 
                         elif msg_type == MessageProtocol.TYPE_LIST_REQ:
                             self.server.send_active_list(self.nickname)
 
+                        elif msg_type == MessageProtocol.TYPE_SEARCH_REQ:
+                            if content:
+                                self.server.send_search_results(self.nickname, content)
+                            else:
+                                self.server.send_system_message(
+                                    self.nickname,
+                                    "Invalid /search format. Use: /search <terms> [with:<nickname>]",
+                                )
+
                         elif msg_type == MessageProtocol.CMD_EXIT:
+                            self.clean_exit = True
                             self.running = False
                             break
 
                         elif msg_type == MessageProtocol.TYPE_PRIVATE:
                             if target and content:
-                                self.server.send_private(self.nickname, target, content)
+                                status = self.server.send_private(
+                                    self.nickname,
+                                    target,
+                                    content,
+                                    msg_id,
+                                    wants_receipt,
+                                )
                             else:
+                                status = "rejected"
                                 self.server.send_system_message(
                                     self.nickname,
                                     "Invalid /msg format. Use: /msg <nickname> <content>",
                                 )
+                            if msg_id:
+                                self.server.acknowledge(self, msg_id, status)
 
                         else:
                             self.server.send_system_message(
@@ -282,6 +451,19 @@ class ClientHandler(threading.Thread):
                                 f"Unknown command or invalid format: {msg_str}",
                             )
 
+                        self.server.command_latency.record(
+                            msg_type, time.perf_counter() - started
+                        )
+
+                        token_age = time.time() - self.token_issued_at
+                        if token_age > self.server.session_tokens.ttl / 2:
+                            self.send_data(
+                                MessageProtocol.encode_message(
+                                    MessageProtocol.TYPE_SESSION,
+                                    {"resume_token": self.issue_resume_token()},
+                                )
+                            )
+
             except ConnectionResetError:
                 break
             except Exception as e:
@@ -289,7 +471,11 @@ class ClientHandler(threading.Thread):
                     "ERROR", f"Client handler error ({self.nickname}): {e}"
                 )
                 break
+            finally:
+                self.dispatching = False
 
+        if self.handed_off:
+            return
         self.close_connection()
         self.logger.log_event("DISCONNECT", f"User {self.nickname} disconnected.")
 
@@ -302,6 +488,15 @@ class ChatServer:
         http_port=8000,
         websocket_port=8001,
         admin_pass="admin123",
+        resume_grace=30,
+        resume_secret=None,
+        tcp_nodelay=True,
+        send_buffer_size=None,
+        recv_buffer_size=None,
+        shed_thresholds=None,
+        headless=False,
+        warm_restart_path=None,
+        capture_path=None,
     ):
         self.host = host
         self.chat_port = chat_port
@@ -309,6 +504,9 @@ class ChatServer:
 
         self.clients = {}
         self.client_handlers = {}
+        # Every open ClientHandler, including ones still logging in.
+        self.connections = set()
+        self.chat_socket = None
 
         self.running = False
 
@@ -317,9 +515,39 @@ class ChatServer:
         self.rate_limiter = RateLimiter()
         self.websocket_port = websocket_port
         self.http_port = http_port
+        # Headless servers never import the web monitor (websockets, asyncio,
+        # http.server) and log without any per-event publishing check.
+        self.headless = headless
         self.web_server_thread = None
 
+        self.profiler = SamplingProfiler()
+        self.command_latency = LatencyHistogram()
+
+        self.file_relay = FileTransferRelay(self)
+
+        self.resume_grace = resume_grace
+        self.session_tokens = SessionTokens(resume_secret)
+        self.session_lock = threading.Lock()
+
+        self.message_ids = MessageIdCache()
+        self.pending_receipts = PendingReceipts()
+
+        self.tcp_nodelay = tcp_nodelay
+        self.send_buffer_size = send_buffer_size
+        self.recv_buffer_size = recv_buffer_size
+
+        self.load_shedder = LoadShedder(self, thresholds=shed_thresholds)
+        self.warm_restart = WarmRestart(self, warm_restart_path)
+
+        # Opt-in recording of client traffic for tools/replay_capture.py.
+        self.capture_path = capture_path
+        self.capture = None
+
     def notify_all_clients_of_list_update(self):
+        if not self.load_shedder.coalesce_presence():
+            self.send_list_update()
+
+    def send_list_update(self):
         active_nicks = self.get_active_nicks()
 
         encoded_msg = MessageProtocol.encode_message(
@@ -339,16 +567,141 @@ class ChatServer:
     def remove_client(self, nickname):
         if nickname in self.clients:
             del self.clients[nickname]
-        if nickname in self.client_handlers:
-            del self.client_handlers[nickname]
-
+        handler = self.client_handlers.pop(nickname, None)
+        if isinstance(handler, DetachedSession):
+            handler.close_connection()
         if nickname:
+            self.file_relay.drop_user(nickname)
+
+        self._announce_departure(nickname)
+
+    def _announce_departure(self, nickname):
+        if nickname and self.load_shedder.level != LEVEL_NORMAL:
             self.broadcast_notification(f"User {nickname} has left the chat.")
             self.notify_all_clients_of_list_update()
+        elif nickname:
+            active_nicks = self.get_active_nicks()
+            frames = (
+                MessageProtocol.encode_message(
+                    MessageProtocol.TYPE_SYSTEM,
+                    {"content": f"User {nickname} has left the chat."},
+                ),
+                MessageProtocol.encode_message(
+                    MessageProtocol.TYPE_LIST,
+                    {"users": active_nicks, "count": len(active_nicks)},
+                ),
+            )
+            for handler in list(self.client_handlers.values()):
+                handler.send_frames(*frames)
             self.logger.log_event(
                 "DISCONNECT", f"Client {nickname} removed from active list."
             )
 
+    def release_client(self, handler):
+        nickname = handler.nickname
+        if not nickname or self.client_handlers.get(nickname) is not handler:
+            return
+
+        self.file_relay.drop_user(nickname)
+
+        if self.running and not handler.clean_exit and self.resume_grace > 0:
+            with self.session_lock:
+                if self.client_handlers.get(nickname) is not handler:
+                    return
+                self._detach_locked(nickname, handler.session_id)
+            self.logger.log_event(
+                "DETACH",
+                f"Connection to {nickname} lost. Holding session for {self.resume_grace}s.",
+            )
+            return
+
+        self.remove_client(nickname)
+
+    def _detach_locked(self, nickname, session_id, grace=None):
+        session = DetachedSession(nickname, session_id)
+        self.client_handlers[nickname] = session
+        self.arm_session_timer(session, self.resume_grace if grace is None else grace)
+        return session
+
+    def arm_session_timer(self, session, grace):
+        session.expires_at = time.time() + grace
+        session.timer = threading.Timer(grace, self._expire_session, args=(session,))
+        session.timer.daemon = True
+        session.timer.start()
+
+    def restore_session(self, nickname, session_id, grace, missed):
+        """Recreates a detached session handed over on a warm restart."""
+        with self.session_lock:
+            session = self._detach_locked(nickname, session_id, grace)
+            session.missed.extend(missed)
+            self.clients[nickname] = None
+
+    def _expire_session(self, session):
+        with self.session_lock:
+            if self.client_handlers.get(session.nickname) is not session:
+                return
+            del self.client_handlers[session.nickname]
+            self.clients.pop(session.nickname, None)
+
+        self._announce_departure(session.nickname)
+
+    def take_over_session(self, token):
+        verified = self.session_tokens.verify(token)
+        if not verified:
+            return None
+        nickname, session_id = verified
+
+        superseded = None
+        with self.session_lock:
+            current = self.client_handlers.get(nickname)
+            if current is None or current.session_id != session_id:
+                return None
+
+            if isinstance(current, DetachedSession):
+                session = current
+            else:
+                # The old connection has not noticed the drop yet.
+                current.superseded = True
+                superseded = current
+                session = self._detach_locked(nickname, session_id)
+
+        if superseded:
+            superseded.close_connection()
+        return session
+
+    def resume_client(self, handler, session):
+        nickname = handler.nickname
+        welcome_msg = MessageProtocol.encode_message(
+            MessageProtocol.TYPE_AUTH_SUCCESS,
+            {
+                "content": f"Welcome back, {nickname}! Your session was resumed.",
+                "resume_token": handler.issue_resume_token(),
+                "resumed": True,
+            },
+        )
+        handler.send_data(welcome_msg)
+
+        while handler.running:
+            with self.session_lock:
+                if self.client_handlers.get(nickname) is not session:
+                    break
+                if not session.missed:
+                    session.close_connection()
+                    self.clients[nickname] = handler.socket
+                    self.client_handlers[nickname] = handler
+                    return
+                missed = list(session.missed)
+                session.missed.clear()
+
+            handler.send_frames(*missed)
+
+        if handler.running:
+            # The grace period ran out while replaying; join normally.
+            self.add_client(nickname, handler.socket, handler.address, handler)
+            self.broadcast_notification(
+                f"User {nickname} has joined the chat.", exclude_nick=nickname
+            )
+
     def is_nickname_active(self, nickname):
         return nickname in self.clients
 
@@ -364,6 +717,9 @@ class ChatServer:
             handler.send_data(encoded_msg)
 
     def broadcast_notification(self, message, exclude_nick=None):
+        if self.load_shedder.defer_notification(message, exclude_nick):
+            return
+
         encoded_msg = MessageProtocol.encode_message(
             MessageProtocol.TYPE_SYSTEM, {"content": message}
         )
@@ -371,26 +727,47 @@ class ChatServer:
             if handler.nickname != exclude_nick:
                 handler.send_data(encoded_msg)
 
-    def broadcast_public(self, sender_nick, content):
+    def send_notifications(self, notifications):
+        """Sends deferred (message, exclude_nick) notifications, one batch
+        per client."""
+        frames = [
+            (
+                MessageProtocol.encode_message(
+                    MessageProtocol.TYPE_SYSTEM, {"content": message}
+                ),
+                exclude_nick,
+            )
+            for message, exclude_nick in notifications
+        ]
+        for handler in list(self.client_handlers.values()):
+            batch = [frame for frame, exclude in frames if exclude != handler.nickname]
+            if batch:
+                handler.send_frames(*batch)
+
+    def broadcast_public(self, sender_nick, content, msg_id=None):
         timestamp = time.strftime("%H:%M:%S")
         display_msg = f"[{timestamp}] <{sender_nick}>: {content}"
 
-        encoded_msg = MessageProtocol.encode_message(
-            MessageProtocol.TYPE_PUBLIC,
-            {"sender": sender_nick, "content": display_msg},
-        )
+        data = {"sender": sender_nick, "content": display_msg}
+        if msg_id:
+            data["id"] = msg_id
+        encoded_msg = MessageProtocol.encode_message(MessageProtocol.TYPE_PUBLIC, data)
 
         for handler in list(self.client_handlers.values()):
             handler.send_data(encoded_msg)
 
-    def send_private(self, sender_nick, target_nick, content):
+    def send_private(
+        self, sender_nick, target_nick, content, msg_id=None, receipt=False
+    ):
+        """Returns the ACK status: "sent", "stored" (recipient offline) or
+        "rejected"."""
         target_handler = self.client_handlers.get(target_nick)
 
         if not self.user_db.is_user_registered(target_nick):
             self.send_system_message(
                 sender_nick, f"Error: User '{target_nick}' is not registered."
             )
-            return
+            return "rejected"
 
         self.logger.log_private(sender_nick, target_nick, content)
 
@@ -398,20 +775,54 @@ class ChatServer:
             timestamp = time.strftime("%H:%M:%S")
             display_msg = f"[{timestamp}] [PRIVATE from {sender_nick}]: {content}"
 
+            data = {"sender": sender_nick, "content": display_msg}
+            if msg_id:
+                data["id"] = msg_id
+                data["receipt"] = receipt
+                if receipt:
+                    self.pending_receipts.expect(target_nick, sender_nick, msg_id)
             encoded_msg = MessageProtocol.encode_message(
-                MessageProtocol.TYPE_PRIVATE,
-                {"sender": sender_nick, "content": display_msg},
+                MessageProtocol.TYPE_PRIVATE, data
             )
             target_handler.send_data(encoded_msg)
 
-            self.send_system_message(
-                sender_nick, f"[Private message sent to {target_nick}]"
-            )
+            # Tagged messages are confirmed by their ACK instead.
+            if not msg_id:
+                self.send_system_message(
+                    sender_nick, f"[Private message sent to {target_nick}]"
+                )
+            return "sent"
         else:
             self.send_system_message(
                 sender_nick,
                 f"Warning: User '{target_nick}' is currently offline. Message logged but not delivered.",
             )
+            return "stored"
+
+    def acknowledge(self, handler, msg_id, status, reason=None):
+        ack = {"id": msg_id, "status": status, "ts": time.time()}
+        if reason:
+            ack["reason"] = reason
+        if status != "rejected":
+            self.message_ids.remember(handler.nickname, msg_id, ack)
+        handler.send_data(MessageProtocol.encode_message(MessageProtocol.TYPE_ACK, ack))
+
+    def relay_receipt(self, recipient_nick, sender_nick, msg_id):
+        """Tells sender_nick that recipient_nick received message msg_id.
+        Receipts that do not match a message sender_nick sent to
+        recipient_nick with a receipt request are dropped. Returns whether
+        the receipt matched."""
+        if not self.pending_receipts.claim(recipient_nick, sender_nick, msg_id):
+            return False
+        handler = self.client_handlers.get(sender_nick)
+        if handler:
+            handler.send_data(
+                MessageProtocol.encode_message(
+                    MessageProtocol.TYPE_RECEIPT,
+                    {"id": msg_id, "from": recipient_nick, "ts": time.time()},
+                )
+            )
+        return True
 
     def send_active_list(self, target_nick):
         active_nicks = self.get_active_nicks()
@@ -423,48 +834,151 @@ class ChatServer:
         if handler:
             handler.send_data(encoded_msg)
 
-    async def publish_log_to_websockets(self, log_entry):
-        if self.web_server_thread and self.web_server_thread.connected_websockets:
-            message = json.dumps({"type": "log", "content": log_entry})
-            if self.web_server_thread.connected_websockets:
-                await asyncio.gather(
-                    *[
-                        ws.send(message)
-                        for ws in self.web_server_thread.connected_websockets
-                    ]
+    def send_search_results(self, target_nick, query):
+        handler = self.client_handlers.get(target_nick)
+        if not handler:
+            return
+
+        # One page at a time: send_frames either writes the page itself or,
+        # past OUTBOUND_HIGH_WATER, waits for the flusher before the next
+        # page is read from disk.
+        shown = 0
+        for page, total, results in self.logger.search_private(target_nick, query):
+            if handler.closed:
+                return
+            shown += len(results)
+            handler.send_frames(
+                MessageProtocol.encode_message(
+                    MessageProtocol.TYPE_SEARCH,
+                    {
+                        "query": query,
+                        "page": page,
+                        "total": total,
+                        "results": results,
+                        "last": shown >= total,
+                    },
                 )
+            )
 
-    def start(self):
-        self.logger = Logger(server_instance=self)
+        if not shown:
+            handler.send_frames(
+                MessageProtocol.encode_message(
+                    MessageProtocol.TYPE_SEARCH,
+                    {
+                        "query": query,
+                        "page": 1,
+                        "total": 0,
+                        "results": [],
+                        "last": True,
+                    },
+                )
+            )
+
+    def _configure_client_socket(self, client_socket):
+        try:
+            if self.tcp_nodelay is not None:
+                client_socket.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.tcp_nodelay)
+                )
+            if self.send_buffer_size:
+                client_socket.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_size
+                )
+            if self.recv_buffer_size:
+                client_socket.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size
+                )
+            self.warm_restart.configure(client_socket)
+        except OSError as e:
+            self.logger.log_event("ERROR", f"Could not set socket options: {e}")
+
+    def create_handler(self, client_socket, address):
+        self._configure_client_socket(client_socket)
+        handler = ClientHandler(client_socket, address, self)
+        self.connections.add(handler)
+        if self.capture is not None:
+            self.capture.open_connection(handler)
+        return handler
+
+    def restart_load_shedder(self):
+        previous = self.load_shedder
+        previous.stop()
+        self.load_shedder = LoadShedder(
+            self,
+            interval=previous.interval,
+            thresholds=previous.thresholds,
+            recover_intervals=previous.recover_intervals,
+        )
+        self.load_shedder.start()
+
+    def _start_web_server(self):
+        from .web_server import WebServerThread
 
         self.web_server_thread = WebServerThread(
             self, self.http_port, self.websocket_port
         )
         self.web_server_thread.start()
+        self.logger.publisher = self.web_server_thread.publish_log
 
+    def start(self):
+        self.logger = Logger(server_instance=self)
+        if self.capture_path:
+            self.capture = TrafficCapture(self.capture_path)
+            self.logger.log_event(
+                "SERVER", f"Capturing client traffic to {self.capture_path}"
+            )
+        self.load_shedder.start()
         self.running = True
 
         try:
-            chat_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            chat_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            chat_socket.bind((self.host, self.chat_port))
-            chat_socket.listen(5)
-            self.logger.log_event(
-                "SERVER", f"Server listening on {self.host}:{self.chat_port}"
-            )
+            # Returns None unless a server is running at warm_restart_path,
+            # and only returns once that server has exited.
+            self.chat_socket = self.warm_restart.take_over()
+
+            if not self.headless:
+                self._start_web_server()
+
+            if self.chat_socket is None:
+                self.chat_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.chat_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.chat_socket.bind((self.host, self.chat_port))
+                # A burst of connects (a reconnect storm, a replay) must not
+                # overflow the accept queue and get reset by the kernel.
+                self.chat_socket.listen(socket.SOMAXCONN)
+                self.logger.log_event(
+                    "SERVER", f"Server listening on {self.host}:{self.chat_port}"
+                )
+            self.warm_restart.configure(self.chat_socket)
+            if self.warm_restart.path:
+                self.warm_restart.start()
 
             while self.running:
-                client_socket, address = chat_socket.accept()
-                handler = ClientHandler(client_socket, address, self)
-                handler.start()
+                if self.warm_restart.pending and self.warm_restart.park(self):
+                    break
+                try:
+                    client_socket, address = self.chat_socket.accept()
+                except BlockingIOError:
+                    continue
+                self.create_handler(client_socket, address).start()
 
         except Exception as e:
             self.logger.log_event("CRITICAL", f"Server error: {e}")
         finally:
             self.running = False
-            self.logger.log_event("SERVER", "Server shutting down...")
+            handed_over = self.warm_restart.completed
+            if handed_over:
+                # Every connection now belongs to the new process, which also
+                # writes the log from here on.
+                self.chat_socket.close()
+                print("Handed over to the new server process.")
+            else:
+                self.logger.log_event("SERVER", "Server shutting down...")
+            self.load_shedder.stop()
             if self.web_server_thread:
                 self.web_server_thread.stop()
 
-            for handler in list(self.client_handlers.values()):
-                handler.close_connection()
+            if not handed_over:
+                for handler in list(self.client_handlers.values()):
+                    handler.close_connection()
+            if self.capture is not None:
+                self.capture.close()
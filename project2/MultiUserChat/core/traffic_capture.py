@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import base64
+import struct
+import threading
+from .protocol import MessageProtocol
+
+MAGIC = b"CHATCAP\x01"
+HEADER = struct.Struct("!d")
+# kind, connection id, microseconds since capture start, data length
+RECORD = struct.Struct("!BIQI")
+
+OPEN = 1
+FRAME = 2
+AUTH_FRAME = 3
+PAYLOAD = 4
+CLOSE = 5
+
+# Stands in for the password of every captured login.
+REDACTED_PASSWORD = "redacted"
+
+KIND_NAMES = {
+    OPEN: "open",
+    FRAME: "frame",
+    AUTH_FRAME: "auth",
+    PAYLOAD: "payload",
+    CLOSE: "close",
+}
+
+
+class CaptureError(Exception):
+    pass
+
+
+def decode_resume_token(token):
+    """Nickname from a resume token, or None. The signature is not checked."""
+    payload = token.strip().rpartition(".")[0]
+    try:
+        padded = payload + "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded))[0]
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+def fake_resume_token(nickname):
+    payload = base64.urlsafe_b64encode(json.dumps([nickname, "0" * 16, 0]).encode())
+    return f"{payload.decode().rstrip('=')}.{'0' * 64}"
+
+
+def redact_login(frame):
+    """A login line with its password, or a resume line with its token,
+    replaced. The nickname stays so a replay logs in the same users."""
+    line = frame.decode(MessageProtocol.ENCODING, errors="replace")
+    stripped = line.rstrip("\r")
+    ending = line[len(stripped) :]
+    stripped = stripped.strip()
+    if stripped.startswith(MessageProtocol.CMD_RESUME + " "):
+        token = stripped[len(MessageProtocol.CMD_RESUME) + 1 :]
+        nickname = decode_resume_token(token) or ""
+        stripped = MessageProtocol.CMD_RESUME + " " + fake_resume_token(nickname)
+    else:
+        nickname, _, password = stripped.partition(" ")
+        if password:
+            stripped = f"{nickname} {REDACTED_PASSWORD}"
+    return (stripped + ending).encode(MessageProtocol.ENCODING)
+
+
+class TrafficCapture:
+    """Records the framed client to server stream of every connection.
+
+    Only what ClientHandler reads off the socket is stored, as whole
+    frames, so a replay sends exactly the same commands with the same
+    spacing. Addresses are never written; connections are numbered in
+    the order they were accepted. Every frame the handler reads as a login
+    or resume attempt is kept as a redacted AUTH_FRAME record, so no
+    password or resume token ever reaches the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.started = time.perf_counter()
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.file = os.fdopen(fd, "wb")
+        self.file.write(MAGIC + HEADER.pack(time.time()))
+
+    def _write(self, kind, conn_id, elapsed, data=b""):
+        micros = int(elapsed * 1_000_000)
+        self.file.write(RECORD.pack(kind, conn_id, micros, len(data)))
+        self.file.write(data)
+
+    def open_connection(self, handler):
+        with self.lock:
+            if self.file.closed:
+                return
+            handler.capture_id = self.next_id
+            self.next_id += 1
+            self._write(OPEN, handler.capture_id, time.perf_counter() - self.started)
+
+    def record(self, handler, frames):
+        """Called with each batch of commands from a logged in client. The
+        batch came from a single recv, so it shares one timestamp."""
+        self._record(handler, FRAME, frames)
+
+    def record_login(self, handler, frame):
+        """Called with each (frame, payload) the handler reads as a login or
+        resume attempt."""
+        self._record(handler, AUTH_FRAME, [frame])
+
+    def _record(self, handler, kind, frames):
+        if handler.capture_id is None:
+            return
+        with self.lock:
+            if self.file.closed:
+                return
+            elapsed = time.perf_counter() - self.started
+            for frame, payload in frames:
+                if kind == AUTH_FRAME:
+                    frame = redact_login(frame)
+                self._write(kind, handler.capture_id, elapsed, frame)
+                if payload is not None:
+                    self._write(PAYLOAD, handler.capture_id, elapsed, payload)
+
+    def close_connection(self, handler):
+        if handler.capture_id is None:
+            return
+        with self.lock:
+            if self.file.closed:
+                return
+            self._write(CLOSE, handler.capture_id, time.perf_counter() - self.started)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+def read_capture(path):
+    """Yields (kind, conn_id, seconds, data) for each record. A capture cut
+    off by a crash ends at its last complete record."""
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC) + HEADER.size)
+        if len(header) < len(MAGIC) + HEADER.size or not header.startswith(MAGIC):
+            raise CaptureError(f"{path} is not a traffic capture.")
+
+        while True:
+            raw = f.read(RECORD.size)
+            if len(raw) < RECORD.size:
+                return
+            kind, conn_id, micros, size = RECORD.unpack(raw)
+            data = f.read(size)
+            if len(data) < size or kind not in KIND_NAMES:
+                return
+            yield kind, conn_id, micros / 1_000_000, data
+
+
+def write_capture(path, records, started_at=0.0):
+    """Writes (kind, conn_id, seconds, data) records, e.g. after rewriting
+    them with tools/anonymize_capture.py. Returns the number written."""
+    count = 0
+    with open(path, "wb") as f:
+        f.write(MAGIC + HEADER.pack(started_at))
+        for kind, conn_id, seconds, data in records:
+            micros = int(round(seconds * 1_000_000))
+            f.write(RECORD.pack(kind, conn_id, micros, len(data)))
+            f.write(data)
+            count += 1
+    return count
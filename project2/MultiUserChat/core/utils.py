@@ -2,8 +2,14 @@ import json
 import os
 import time
 import hashlib
-import asyncio
+import hmac
+import base64
+import secrets
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from .log_index import LogIndex
+from .search_index import SearchIndex
 
 
 class UserDatabase:
@@ -21,6 +27,9 @@ class UserDatabase:
                 return {}
         return {}
 
+    def reload(self):
+        self.users = self._load_users()
+
     def _save_users(self):
         with open(self.db_file, "w") as f:
             json.dump(self.users, f, indent=4)
@@ -61,6 +70,7 @@ class UserDatabase:
 
 LOG_BASE_PATH = "log"
 USER_DATA_PATH = os.path.join(LOG_BASE_PATH, "user_data")
+SEARCH_INDEX_PATH = os.path.join(LOG_BASE_PATH, "search_index")
 
 
 class Logger:
@@ -71,48 +81,80 @@ class Logger:
         self.user_data_path = USER_DATA_PATH
         os.makedirs(self.user_data_path, exist_ok=True)
         self.system_log_file = os.path.join(self.base_path, "system_events.log")
-
-    def _get_chat_file_path(self, user1, user2):
+        self.system_log_index = LogIndex(self.system_log_file)
+        self.chat_log_lock = threading.Lock()
+        self.search_index = SearchIndex(self.user_data_path, SEARCH_INDEX_PATH)
+        # Set by ChatServer when the web monitor runs; None in headless mode.
+        self.publisher = None
+        # Set once a warm restart has handed the logs to a new process.
+        self.muted = False
+
+    def _get_chat_file_path(self, user1, user2, day):
         sender_dir = os.path.join(self.user_data_path, user1)
         os.makedirs(sender_dir, exist_ok=True)
         chat_dir = os.path.join(sender_dir, user2)
         os.makedirs(chat_dir, exist_ok=True)
-        today_str = datetime.now().strftime("%Y%m%d")
-        return os.path.join(chat_dir, f"{today_str}.log")
+        return os.path.join(chat_dir, f"{day}.log")
 
     def _write_log(self, file_path, log_entry):
         try:
-            with open(file_path, "a", encoding="utf-8") as f:
-                f.write(f"{log_entry}\n")
+            with open(file_path, "ab") as f:
+                offset = f.tell()
+                f.write(log_entry)
+                return offset
         except Exception as e:
             print(f"[FATAL LOG ERROR] Failed to write log to {file_path}: {e}")
+            return None
 
     def log_event(self, level, message):
-        timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-        log_entry = f"{timestamp} [{level.upper()}]: {message}"
+        if self.muted:
+            return
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_entry = f"[{timestamp}] [{level.upper()}]: {message}"
         print(log_entry)
-        self._write_log(self.system_log_file, log_entry)
-        if (
-            self.server_instance
-            and self.server_instance.web_server_thread
-            and self.server_instance.web_server_thread.loop
-        ):
-
-            asyncio.run_coroutine_threadsafe(
-                self.server_instance.publish_log_to_websockets(log_entry),
-                self.server_instance.web_server_thread.loop,
+        try:
+            with self.system_log_index.lock:
+                self.system_log_index.append(
+                    timestamp, f"{log_entry}\n".encode("utf-8")
+                )
+        except Exception as e:
+            print(
+                f"[FATAL LOG ERROR] Failed to write log to {self.system_log_file}: {e}"
             )
+        if self.publisher is not None:
+            self.publisher(level, log_entry)
+
+    def query_events(self, **filters):
+        return self.system_log_index.query(**filters)
 
     def log_public(self, sender, content):
         self.log_event("PUBLIC_MSG", f"<{sender}>: {content}")
 
     def log_private(self, sender, recipient, content):
-        timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S]")
-        log_entry = f"{timestamp} <{sender} -> {recipient}>: {content}"
-        sender_path = self._get_chat_file_path(sender, recipient)
-        self._write_log(sender_path, log_entry)
-        recipient_path = self._get_chat_file_path(recipient, sender)
-        self._write_log(recipient_path, log_entry)
+        if self.muted:
+            return
+        now = datetime.now()
+        timestamp = now.strftime("[%Y-%m-%d %H:%M:%S]")
+        day = now.strftime("%Y%m%d")
+        log_entry = f"{timestamp} <{sender} -> {recipient}>: {content}\n".encode(
+            "utf-8"
+        )
+
+        conversations = [(sender, recipient)]
+        if recipient != sender:
+            conversations.append((recipient, sender))
+
+        with self.chat_log_lock:
+            for owner, partner in conversations:
+                file_path = self._get_chat_file_path(owner, partner, day)
+                offset = self._write_log(file_path, log_entry)
+                if offset is not None:
+                    self.search_index.add_record(
+                        owner, partner, day, offset, len(log_entry), content
+                    )
+
+    def search_private(self, owner, query):
+        return self.search_index.search(owner, query)
 
 
 class RateLimiter:
@@ -120,6 +162,8 @@ class RateLimiter:
         self.max_messages = max_messages
         self.window_seconds = window_seconds
         self.message_timestamps = {}
+        # Lowered by the load shedder while the server is saturated.
+        self.limit_factor = 1.0
 
     def check_and_update(self, nickname):
         current_time = time.time()
@@ -133,8 +177,123 @@ class RateLimiter:
             t for t in timestamps if t > current_time - self.window_seconds
         ]
 
-        if len(timestamps) >= self.max_messages:
+        if len(timestamps) >= max(1, int(self.max_messages * self.limit_factor)):
             return True
         else:
             timestamps.append(current_time)
             return False
+
+
+MESSAGE_ID_CACHE_SIZE = 512
+
+
+class MessageIdCache:
+    """Remembers the ACK sent for each recent client message id, per user,
+    so a message retried after a reconnect is acknowledged again instead
+    of being delivered twice."""
+
+    def __init__(self, per_user=MESSAGE_ID_CACHE_SIZE):
+        self.per_user = per_user
+        self.acks = {}
+        self.lock = threading.Lock()
+
+    def get(self, nickname, msg_id):
+        with self.lock:
+            return self.acks.get(nickname, {}).get(msg_id)
+
+    def remember(self, nickname, msg_id, ack):
+        with self.lock:
+            acks = self.acks.setdefault(nickname, OrderedDict())
+            acks[msg_id] = ack
+            if len(acks) > self.per_user:
+                acks.popitem(last=False)
+
+
+class PendingReceipts:
+    """Private messages delivered with a receipt request, per recipient.
+    Only the recipient of such a message can confirm it, and only once."""
+
+    def __init__(self, per_user=MESSAGE_ID_CACHE_SIZE):
+        self.per_user = per_user
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def expect(self, recipient, sender, msg_id):
+        with self.lock:
+            pending = self.pending.setdefault(recipient, OrderedDict())
+            pending[(sender, msg_id)] = True
+            if len(pending) > self.per_user:
+                pending.popitem(last=False)
+
+    def claim(self, recipient, sender, msg_id):
+        with self.lock:
+            pending = self.pending.get(recipient)
+            return bool(pending) and pending.pop((sender, msg_id), False)
+
+
+class TransferRateLimiter:
+    """Token bucket of bytes per second for file transfer traffic, kept
+    separate from the chat RateLimiter. reserve() returns how long the
+    caller should wait before sending."""
+
+    def __init__(self, bytes_per_second=1024 * 1024, burst=256 * 1024):
+        self.bytes_per_second = bytes_per_second
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, nickname, nbytes):
+        current_time = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(nickname, (self.burst, current_time))
+            tokens = min(
+                self.burst, tokens + (current_time - last) * self.bytes_per_second
+            )
+            tokens -= nbytes
+            self.buckets[nickname] = (tokens, current_time)
+
+        if tokens >= 0:
+            return 0.0
+        return -tokens / self.bytes_per_second
+
+
+RESUME_TOKEN_TTL = 900
+
+
+class SessionTokens:
+    """Issues and verifies HMAC-signed session resume tokens."""
+
+    def __init__(self, secret=None, ttl=RESUME_TOKEN_TTL):
+        self.secret = secret or secrets.token_bytes(32)
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload.encode(), hashlib.sha256).hexdigest()
+
+    def issue(self, nickname, session_id):
+        expires_at = int(time.time() + self.ttl)
+        payload = (
+            base64.urlsafe_b64encode(
+                json.dumps([nickname, session_id, expires_at]).encode()
+            )
+            .decode()
+            .rstrip("=")
+        )
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        payload, _, signature = token.strip().rpartition(".")
+        if not payload or not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+
+        try:
+            padded = payload + "=" * (-len(payload) % 4)
+            nickname, session_id, expires_at = json.loads(
+                base64.urlsafe_b64decode(padded)
+            )
+        except (ValueError, TypeError):
+            return None
+
+        if expires_at < time.time():
+            return None
+        return nickname, session_id
@@ -0,0 +1,470 @@
+import os
+import json
+import time
+import base64
+import socket
+import struct
+import threading
+from collections import OrderedDict
+from .file_transfer import FileTransfer
+
+READ_POLL_INTERVAL = 0.5
+HANDOFF_TIMEOUT = 10.0
+MAX_FDS_PER_MESSAGE = 200
+STATE_VERSION = 1
+ADOPTED = b"ADOPTED\n"
+
+
+class HandoffError(Exception):
+    pass
+
+
+def _encode(data):
+    return None if data is None else base64.b64encode(data).decode("ascii")
+
+
+def _decode(text):
+    return None if text is None else base64.b64decode(text)
+
+
+def _recv_exactly(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise HandoffError("Connection closed during handoff.")
+        data += chunk
+    return bytes(data)
+
+
+def check_peer(conn):
+    """Both sides of a handoff must run as the same user; the state carries
+    every client socket and the resume token secret."""
+    creds = conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", creds)
+    if uid != os.getuid():
+        raise HandoffError(f"Peer runs as uid {uid}, expected {os.getuid()}.")
+
+
+def send_handoff(conn, fds, state):
+    """Sends the descriptors with SCM_RIGHTS in batches, then the state as
+    length-prefixed JSON. A zero batch count ends the descriptor list."""
+    for start in range(0, len(fds), MAX_FDS_PER_MESSAGE):
+        batch = fds[start : start + MAX_FDS_PER_MESSAGE]
+        socket.send_fds(conn, [struct.pack("!I", len(batch))], batch)
+
+    payload = json.dumps(state).encode("utf-8")
+    conn.sendall(struct.pack("!IQ", 0, len(payload)) + payload)
+
+
+def receive_handoff(conn):
+    fds = []
+    try:
+        while True:
+            data, batch, flags, _ = socket.recv_fds(conn, 4, MAX_FDS_PER_MESSAGE)
+            fds += batch
+            if len(data) != 4 or flags & socket.MSG_CTRUNC:
+                raise HandoffError("Descriptor batch was truncated.")
+            (count,) = struct.unpack("!I", data)
+            if count != len(batch):
+                raise HandoffError(f"Expected {count} descriptors, got {len(batch)}.")
+            if not count:
+                break
+
+        (size,) = struct.unpack("!Q", _recv_exactly(conn, 8))
+        state = json.loads(_recv_exactly(conn, size))
+        if state.get("version") != STATE_VERSION:
+            raise HandoffError(f"Unsupported state version {state.get('version')}.")
+        return fds, state
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+class WarmRestart(threading.Thread):
+    """Hands the listening socket and every live connection to a newly
+    started server process, so a restart does not disconnect anyone.
+
+    The running server listens on a Unix socket at path. A new server
+    started with the same path connects to it, and the old one parks its
+    reader threads between frames, passes the sockets with SCM_RIGHTS
+    together with nickname, rate limit, message id and file transfer
+    state, and exits once the new process has adopted them. Sockets get
+    an SO_RCVTIMEO of READ_POLL_INTERVAL so blocked readers notice the
+    handoff; without a path nothing changes.
+    """
+
+    def __init__(self, server_instance, path=None, timeout=HANDOFF_TIMEOUT):
+        super().__init__(daemon=True, name="WarmRestart")
+        self.server = server_instance
+        self.path = path
+        self.timeout = timeout
+
+        self.pending = False
+        self.completed = False
+        self.condition = threading.Condition()
+        self.parked = set()
+        self.transferred = set()
+        self.listener = None
+        self.handoff_conn = None
+
+    def configure(self, sock):
+        if self.path:
+            sock.setsockopt(
+                socket.SOL_SOCKET,
+                socket.SO_RCVTIMEO,
+                struct.pack("@ll", 0, int(READ_POLL_INTERVAL * 1_000_000)),
+            )
+
+    def park(self, owner):
+        """Holds a reader thread while a handoff is in progress. Returns
+        True if its socket now belongs to the new process."""
+        with self.condition:
+            self.parked.add(owner)
+            self.condition.notify_all()
+            while self.pending:
+                self.condition.wait()
+            self.parked.discard(owner)
+            return owner in self.transferred
+
+    # Old process side.
+
+    def _listen(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.listener.listen(1)
+
+    def run(self):
+        self._listen()
+        self.server.logger.log_event(
+            "WARM_RESTART", f"Accepting warm restart handoffs on {self.path}"
+        )
+        while not self.completed:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            try:
+                check_peer(conn)
+            except (HandoffError, OSError) as e:
+                conn.close()
+                self.server.logger.log_event(
+                    "WARN", f"Refused warm restart handoff: {e}"
+                )
+                continue
+
+            # The new process binds the path once it has taken over.
+            self.listener.close()
+            os.unlink(self.path)
+            try:
+                conn.settimeout(self.timeout)
+                self._hand_over(conn)
+            except Exception as e:
+                conn.close()
+                self.server.logger.log_event(
+                    "ERROR", f"Warm restart failed, keeping connections: {e}"
+                )
+                self._listen()
+            else:
+                # Left open until this process exits; the new one waits for
+                # that before it binds the web monitor ports.
+                self.handoff_conn = conn
+
+    def _all_parked(self):
+        return self.server in self.parked and all(
+            handler in self.parked or handler.closed
+            for handler in list(self.server.connections)
+        )
+
+    def _hand_over(self, conn):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            self.pending = True
+            # Re-checked periodically as well, since closing connections
+            # do not notify.
+            while not self._all_parked():
+                if time.monotonic() > deadline:
+                    self._resume()
+                    raise HandoffError("Reader threads did not stop in time.")
+                self.condition.wait(0.1)
+
+        handlers, sessions = [], []
+        try:
+            shedder = self.server.load_shedder
+            shedder.stop()
+            shedder.join(self.timeout)
+            shedder.drain()
+
+            handlers, sessions = self._capture()
+            state = self._export_state(handlers, sessions)
+            fds = [self.server.chat_socket.fileno()]
+            fds += [handler.socket.fileno() for handler in handlers]
+
+            self.server.logger.log_event(
+                "WARM_RESTART",
+                f"Handing over {len(handlers)} connection(s) and "
+                f"{len(state['sessions'])} detached session(s).",
+            )
+            send_handoff(conn, fds, state)
+            if _recv_exactly(conn, len(ADOPTED)) != ADOPTED:
+                raise HandoffError("New process did not confirm the handoff.")
+        except Exception:
+            self._roll_back(handlers, sessions)
+            raise
+
+        # Nothing is logged from here on; the new process owns the log, and
+        # closing what stays behind would otherwise still write to it.
+        self.server.logger.muted = True
+        with self.condition:
+            self.completed = True
+            self.transferred.update(handlers)
+            self.transferred.add(self.server)
+            for handler in handlers:
+                handler.handed_off = True
+                handler.socket.close()
+            self._resume()
+
+        # Connections that could not be paused cleanly resume their session
+        # with the new process after this disconnect.
+        for handler in list(self.server.connections):
+            if handler not in self.transferred:
+                handler.superseded = True
+                handler.close_connection()
+        self.server.running = False
+
+    def _resume(self):
+        self.pending = False
+        self.condition.notify_all()
+
+    def _capture(self):
+        """Stops the parked connections from sending and cancels session
+        expiry. Anything still flushing to a slow reader stays behind."""
+        handlers = []
+        for handler in list(self.server.connections):
+            if handler not in self.parked:
+                continue
+            with handler.outbound_lock:
+                if handler.closed or handler.flushing:
+                    continue
+                handler.closed = True
+            handlers.append(handler)
+
+        sessions = []
+        with self.server.session_lock:
+            for session in list(self.server.client_handlers.values()):
+                if getattr(session, "timer", None) is not None:
+                    session.timer.cancel()
+                    sessions.append(session)
+        return handlers, sessions
+
+    def _roll_back(self, handlers, sessions):
+        for handler in handlers:
+            handler.closed = False
+        with self.server.session_lock:
+            for session in sessions:
+                if self.server.client_handlers.get(session.nickname) is session:
+                    self.server.arm_session_timer(
+                        session, max(0.0, session.expires_at - time.time())
+                    )
+
+        self.server.restart_load_shedder()
+        with self.condition:
+            self._resume()
+
+    def _export_state(self, handlers, sessions):
+        server = self.server
+        now = time.time()
+
+        clients = []
+        for handler in handlers:
+            frame_buffer = handler.frame_buffer
+            clients.append(
+                {
+                    "nickname": handler.nickname,
+                    "address": list(handler.address),
+                    "session_id": handler.session_id,
+                    "token_issued_at": handler.token_issued_at,
+                    "buffer": _encode(bytes(frame_buffer.buffer)),
+                    "scanned": frame_buffer.scanned,
+                    "chunk_header": _encode(frame_buffer.chunk_header),
+                    "chunk_size": frame_buffer.chunk_size,
+                    "pending_frames": [
+                        [_encode(frame), _encode(payload)]
+                        for frame, payload in handler.pending_frames
+                    ],
+                }
+            )
+
+        detached = [
+            {
+                "nickname": session.nickname,
+                "session_id": session.session_id,
+                "remaining": max(0.0, session.expires_at - now),
+                "missed": [_encode(frame) for frame in session.missed],
+            }
+            for session in sessions
+        ]
+        # Logged-in connections left behind come back with their resume token.
+        captured = set(handlers).union(sessions)
+        for handler in list(server.client_handlers.values()):
+            if handler not in captured:
+                detached.append(
+                    {
+                        "nickname": handler.nickname,
+                        "session_id": handler.session_id,
+                        "remaining": server.resume_grace,
+                        "missed": [],
+                    }
+                )
+
+        with server.message_ids.lock:
+            message_ids = {
+                nickname: list(acks.items())
+                for nickname, acks in server.message_ids.acks.items()
+            }
+        with server.pending_receipts.lock:
+            pending_receipts = {
+                recipient: list(pending)
+                for recipient, pending in server.pending_receipts.pending.items()
+            }
+        with server.file_relay.lock:
+            transfers = [
+                vars(transfer) for transfer in server.file_relay.transfers.values()
+            ]
+        with server.file_relay.rate_limiter.lock:
+            transfer_buckets = dict(server.file_relay.rate_limiter.buckets)
+
+        return {
+            "version": STATE_VERSION,
+            "pid": os.getpid(),
+            "clients": clients,
+            "sessions": detached,
+            "rate_limits": dict(server.rate_limiter.message_timestamps),
+            "message_ids": message_ids,
+            "pending_receipts": pending_receipts,
+            "transfers": transfers,
+            "transfer_buckets": transfer_buckets,
+            "resume_secret": server.session_tokens.secret.hex(),
+        }
+
+    # New process side.
+
+    def take_over(self):
+        """Adopts the connections of the server running at path. Returns
+        its listening socket, or None if no server is running there."""
+        if not self.path or not os.path.exists(self.path):
+            return None
+
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            conn.close()
+            return None
+
+        with conn:
+            check_peer(conn)
+            conn.settimeout(self.timeout)
+            fds, state = receive_handoff(conn)
+            if len(fds) != len(state["clients"]) + 1:
+                for fd in fds:
+                    os.close(fd)
+                raise HandoffError("Descriptor count does not match the state.")
+
+            listener = socket.socket(fileno=fds[0])
+            handlers = self._import_state(state, fds[1:])
+            conn.sendall(ADOPTED)
+
+            for handler in handlers:
+                handler.start()
+            self.server.logger.log_event(
+                "WARM_RESTART",
+                f"Took over {len(handlers)} connection(s) and "
+                f"{len(state['sessions'])} detached session(s) from process "
+                f"{state['pid']}",
+            )
+
+            try:
+                conn.recv(1)
+            except socket.timeout:
+                self.server.logger.log_event(
+                    "WARN", "Previous server process is still running."
+                )
+        # Shutting down its web monitor may have logged a few more lines.
+        with self.server.logger.system_log_index.lock:
+            self.server.logger.system_log_index.refresh()
+        return listener
+
+    def _import_state(self, state, fds):
+        server = self.server
+
+        # The old process kept logging and registering users until it
+        # paused; pick those up before anything new is written.
+        with server.logger.system_log_index.lock:
+            server.logger.system_log_index.refresh()
+        server.user_db.reload()
+
+        server.session_tokens.secret = bytes.fromhex(state["resume_secret"])
+        server.rate_limiter.message_timestamps.update(state["rate_limits"])
+        for nickname, acks in state["message_ids"].items():
+            server.message_ids.acks[nickname] = OrderedDict(
+                (msg_id, ack) for msg_id, ack in acks
+            )
+        for recipient, pending in state.get("pending_receipts", {}).items():
+            server.pending_receipts.pending[recipient] = OrderedDict(
+                ((sender, msg_id), True) for sender, msg_id in pending
+            )
+        for fields in state["transfers"]:
+            transfer = FileTransfer(
+                fields["transfer_id"],
+                fields["sender"],
+                fields["recipient"],
+                fields["name"],
+                fields["size"],
+            )
+            vars(transfer).update(fields)
+            server.file_relay.transfers[transfer.transfer_id] = transfer
+        server.file_relay.rate_limiter.buckets.update(
+            (nickname, tuple(bucket))
+            for nickname, bucket in state["transfer_buckets"].items()
+        )
+
+        handlers = []
+        for fields, fd in zip(state["clients"], fds):
+            client_socket = socket.socket(fileno=fd)
+            client_socket.setblocking(True)
+            handler = server.create_handler(client_socket, tuple(fields["address"]))
+            handler.adopted = True
+            handler.nickname = fields["nickname"]
+            handler.session_id = fields["session_id"]
+            handler.token_issued_at = fields["token_issued_at"]
+
+            frame_buffer = handler.frame_buffer
+            frame_buffer.buffer = bytearray(_decode(fields["buffer"]))
+            frame_buffer.scanned = fields["scanned"]
+            frame_buffer.chunk_header = _decode(fields["chunk_header"])
+            frame_buffer.chunk_size = fields["chunk_size"]
+            handler.pending_frames = [
+                (_decode(frame), _decode(payload))
+                for frame, payload in fields["pending_frames"]
+            ]
+
+            if handler.nickname:
+                server.clients[handler.nickname] = client_socket
+                server.client_handlers[handler.nickname] = handler
+            handlers.append(handler)
+
+        for fields in state["sessions"]:
+            server.restore_session(
+                fields["nickname"],
+                fields["session_id"],
+                fields["remaining"],
+                [_decode(frame) for frame in fields["missed"]],
+            )
+        return handlers
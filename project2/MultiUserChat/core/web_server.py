@@ -0,0 +1,320 @@
+import os
+import re
+import json
+import math
+import asyncio
+import threading
+from functools import partial
+from urllib.parse import urlparse, parse_qs
+from websockets.server import serve as serve_websocket
+from http.server import SimpleHTTPRequestHandler, HTTPServer
+from .protocol import MessageProtocol
+from .profiling import LoopLagMonitor, MAX_PROFILE_SECONDS, MIN_SAMPLE_INTERVAL
+
+QUERY_TIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}:\d{2})?$")
+
+
+def _parse_query_time(value, end_of_day=False):
+    if value is None:
+        return None
+    if not QUERY_TIME_RE.match(value):
+        raise ValueError(f"Invalid time '{value}'. Use YYYY-MM-DD[ HH:MM:SS].")
+    if len(value) == 10:
+        return f"{value} 23:59:59" if end_of_day else f"{value} 00:00:00"
+    return value.replace("T", " ")
+
+
+class MonitorRequestHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, server_instance=None, **kwargs):
+        self.server_instance = server_instance
+        super().__init__(*args, **kwargs)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode(MessageProtocol.ENCODING)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _is_admin(self):
+        password = self.headers.get("X-Admin-Password")
+        if password != self.server_instance.admin_password:
+            self._send_json(401, {"error": "Authentication required."})
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/logs":
+            if self._is_admin():
+                self._handle_log_query(parse_qs(url.query))
+        elif url.path == "/api/profile.folded":
+            if self._is_admin():
+                self._handle_profile_download()
+        else:
+            super().do_GET()
+
+    def _handle_profile_download(self):
+        profile = self.server_instance.profiler.last_profile
+        if profile is None:
+            self._send_json(404, {"error": "No profile has been recorded yet."})
+            return
+
+        body = profile.encode(MessageProtocol.ENCODING)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Disposition", 'attachment; filename="profile.folded"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle_log_query(self, params):
+
+        def param(name):
+            values = params.get(name)
+            return values[0] if values and values[0] else None
+
+        try:
+            levels = param("level")
+            cursor = param("cursor")
+            if cursor is not None and not cursor.isdigit():
+                raise ValueError("Invalid cursor.")
+            result = self.server_instance.logger.query_events(
+                start=_parse_query_time(param("start")),
+                end=_parse_query_time(param("end"), end_of_day=True),
+                levels=levels.split(",") if levels else None,
+                nickname=param("nick"),
+                cursor=int(cursor) if cursor is not None else None,
+                limit=int(param("limit") or 100),
+            )
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        self._send_json(200, result)
+
+
+class WebServerThread(threading.Thread):
+    def __init__(self, server_instance, http_port, websocket_port):
+        super().__init__()
+        self.server_instance = server_instance
+        self.http_port = http_port
+        self.websocket_port = websocket_port
+        self.running = True
+        self.httpd = None
+        self.websocket_server = None
+        self.connected_websockets = set()
+        self.loop = None
+        self.loop_lag = LoopLagMonitor()
+
+    def _start_http_server(self):
+        try:
+            static_dir = os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "..", "static"
+            )
+
+            handler = partial(
+                MonitorRequestHandler,
+                server_instance=self.server_instance,
+                directory=static_dir,
+            )
+            self.httpd = HTTPServer(("", self.http_port), handler)
+            self.server_instance.logger.log_event(
+                "WEB", f"HTTP Server listening on port {self.http_port}"
+            )
+
+            self.httpd.serve_forever()
+
+        except Exception as e:
+            self.server_instance.logger.log_event(
+                "CRITICAL_HTTP", f"HTTP Server error: {e}"
+            )
+
+    async def _handle_websocket_connection(self, websocket):
+        self.connected_websockets.add(websocket)
+        self.server_instance.logger.log_event(
+            "WEBSOCKET", f"New connection from {websocket.remote_address}"
+        )
+
+        try:
+            password = await websocket.recv()
+            if password != self.server_instance.admin_password:
+                await websocket.send("Authentication Failed. Connection closed.")
+                self.server_instance.logger.log_event(
+                    "WEBSOCKET_FAIL",
+                    f"Failed authentication attempt from {websocket.remote_address}",
+                )
+                await websocket.close()
+                return
+
+            await websocket.send("Authentication Success. Receiving live logs.")
+            self.server_instance.logger.log_event(
+                "WEBSOCKET_AUTH", f"Client authenticated successfully."
+            )
+
+            async for message in websocket:
+                await self._handle_admin_command(websocket, message)
+
+        except Exception:
+            pass
+        finally:
+            self.connected_websockets.remove(websocket)
+            self.server_instance.logger.log_event("WEBSOCKET", f"Connection closed.")
+
+    async def _handle_admin_command(self, websocket, message):
+        try:
+            request = json.loads(message)
+            command = request.get("command")
+        except (ValueError, AttributeError):
+            await websocket.send(
+                json.dumps({"type": "error", "content": "Invalid admin command."})
+            )
+            return
+
+        profiler = self.server_instance.profiler
+
+        if command == "profile_start":
+            try:
+                seconds = float(request.get("seconds", 10))
+                interval = float(request.get("interval_ms", 5)) / 1000
+                if not (math.isfinite(interval) and 0 < seconds < math.inf):
+                    raise ValueError
+            except (TypeError, ValueError):
+                await websocket.send(
+                    json.dumps(
+                        {
+                            "type": "error",
+                            "content": "seconds must be a positive number and "
+                            "interval_ms a number.",
+                        }
+                    )
+                )
+                return
+            seconds = min(seconds, MAX_PROFILE_SECONDS)
+            interval = max(interval, MIN_SAMPLE_INTERVAL)
+            if not profiler.start(seconds, interval):
+                await websocket.send(
+                    json.dumps(
+                        {"type": "error", "content": "Profiler is already running."}
+                    )
+                )
+                return
+            self.server_instance.logger.log_event(
+                "PROFILER", f"Sampling profiler started for {seconds}s."
+            )
+            await websocket.send(json.dumps({"type": "profile", "status": "started"}))
+            asyncio.get_running_loop().create_task(self._report_profile(websocket))
+
+        elif command == "profile_stop":
+            summary = await asyncio.get_running_loop().run_in_executor(
+                None, profiler.stop
+            )
+            await websocket.send(
+                json.dumps({"type": "profile", "status": "stopped", **summary})
+            )
+
+        elif command == "latency":
+            await websocket.send(
+                json.dumps(
+                    {
+                        "type": "latency",
+                        "commands": self.server_instance.command_latency.snapshot(),
+                    }
+                )
+            )
+            if request.get("reset"):
+                self.server_instance.command_latency.reset()
+
+        elif command == "load":
+            await websocket.send(
+                json.dumps(
+                    {"type": "load", **self.server_instance.load_shedder.snapshot()}
+                )
+            )
+
+        elif command == "loop_lag":
+            await websocket.send(
+                json.dumps({"type": "loop_lag", **self.loop_lag.snapshot()})
+            )
+
+        else:
+            await websocket.send(
+                json.dumps(
+                    {"type": "error", "content": f"Unknown admin command: {command}"}
+                )
+            )
+
+    async def _report_profile(self, websocket):
+        profiler = self.server_instance.profiler
+        await asyncio.get_running_loop().run_in_executor(None, profiler.wait)
+        try:
+            await websocket.send(
+                json.dumps(
+                    {
+                        "type": "profile",
+                        "status": "finished",
+                        "download": "/api/profile.folded",
+                        **profiler.summary(),
+                    }
+                )
+            )
+        except Exception:
+            pass
+
+    def publish_log(self, level, log_entry):
+        """Called by Logger for every event; cheap when nobody is watching."""
+        if not self.loop or not self.connected_websockets:
+            return
+        if not self.server_instance.load_shedder.should_publish(level):
+            return
+        asyncio.run_coroutine_threadsafe(self._broadcast_log(log_entry), self.loop)
+
+    async def _broadcast_log(self, log_entry):
+        message = json.dumps({"type": "log", "content": log_entry})
+        await asyncio.gather(
+            *[ws.send(message) for ws in list(self.connected_websockets)],
+            return_exceptions=True,
+        )
+
+    async def _start_websocket_server(self):
+        asyncio.get_running_loop().create_task(self.loop_lag.run())
+        self.websocket_server = serve_websocket(
+            self._handle_websocket_connection, "0.0.0.0", self.websocket_port
+        )
+        async with self.websocket_server as server:
+            await server.serve_forever()
+
+    def run(self):
+        self.logger = self.server_instance.logger
+
+        http_thread = threading.Thread(target=self._start_http_server)
+        http_thread.daemon = True
+        http_thread.start()
+
+        try:
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.logger.log_event(
+                "WEB", f"WebSocket Server starting on port {self.websocket_port}"
+            )
+
+            self.loop.run_until_complete(self._start_websocket_server())
+
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.logger.log_event("CRITICAL_WEB", f"Async Loop error: {e}")
+
+    def _cancel_tasks(self):
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+
+    def stop(self):
+        self.running = False
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        if self.loop:
+            # Lets the WebSocket server close its socket and connections.
+            self.loop.call_soon_threadsafe(self._cancel_tasks)
@@ -41,7 +41,7 @@ function connectWebSocket() {
                 disconnectWebSocket();
             } else {
                 // Canlı log girişi
-                logEntry.textContent = data;
+                logEntry.textContent = formatServerMessage(data);
 
                 // Log seviyesini (ERROR, LOGIN, vb.) renklendirmek için
                 const match = data.match(/\[([A-Z_]+)\]/);
@@ -70,8 +70,90 @@ function connectWebSocket() {
     }
 }
 
+function formatServerMessage(data) {
+    let message;
+    try {
+        message = JSON.parse(data);
+    } catch (e) {
+        return data;
+    }
+    if (message.type === 'log') {
+        return message.content;
+    }
+    return `[ADMIN] ${JSON.stringify(message)}`;
+}
+
+function sendAdminCommand(command, options = {}) {
+    if (!socket || socket.readyState !== WebSocket.OPEN) {
+        document.getElementById('status').textContent = 'Connect before sending admin commands.';
+        return;
+    }
+    socket.send(JSON.stringify({ command, ...options }));
+}
+
+async function downloadProfile() {
+    const password = document.getElementById('password').value;
+    const response = await fetch('/api/profile.folded', {
+        headers: { 'X-Admin-Password': password }
+    });
+    if (!response.ok) {
+        document.getElementById('status').textContent = `Profile download failed (${response.status})`;
+        return;
+    }
+    const link = document.createElement('a');
+    link.href = URL.createObjectURL(await response.blob());
+    link.download = 'profile.folded';
+    link.click();
+    URL.revokeObjectURL(link.href);
+}
+
 function disconnectWebSocket() {
     if (socket) {
         socket.close();
     }
-}
\ No newline at end of file
+}
+
+let nextCursor = null;
+
+async function queryHistory(cursor) {
+    const password = document.getElementById('password').value;
+    const container = document.getElementById('history-container');
+    const nextButton = document.getElementById('query-next');
+    const params = new URLSearchParams();
+
+    const fields = { start: 'query-start', end: 'query-end', level: 'query-level', nick: 'query-nick' };
+    for (const [name, id] of Object.entries(fields)) {
+        const value = document.getElementById(id).value.trim();
+        if (value) {
+            params.set(name, value);
+        }
+    }
+    if (cursor !== undefined && cursor !== null) {
+        params.set('cursor', cursor);
+    } else {
+        container.innerHTML = '';
+    }
+
+    try {
+        const response = await fetch(`/api/logs?${params}`, {
+            headers: { 'X-Admin-Password': password }
+        });
+        const result = await response.json();
+        if (!response.ok) {
+            container.textContent = result.error || `Query failed (${response.status})`;
+            nextButton.disabled = true;
+            return;
+        }
+
+        for (const event of result.events) {
+            const entry = document.createElement('div');
+            entry.className = `log-entry ${event.level}`;
+            entry.textContent = `[${event.timestamp}] [${event.level}]: ${event.message}`;
+            container.appendChild(entry);
+        }
+        nextCursor = result.next_cursor;
+        nextButton.disabled = nextCursor === null;
+    } catch (e) {
+        container.textContent = `Error: ${e.message}`;
+    }
+}
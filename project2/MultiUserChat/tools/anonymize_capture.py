@@ -0,0 +1,193 @@
+import sys
+import os
+import random
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.protocol import MessageProtocol
+from core.traffic_capture import (
+    OPEN,
+    FRAME,
+    AUTH_FRAME,
+    PAYLOAD,
+    CLOSE,
+    decode_resume_token,
+    fake_resume_token,
+    read_capture,
+    write_capture,
+)
+
+# Same UTF-8 width as the character it replaces, so frame sizes and the
+# server's tokenizing work stay what they were.
+FILLERS = {1: "abcdefghijklmnopqrstuvwxyz", 2: "éüßçñ", 3: "€あ中", 4: "😀"}
+DIGITS = "0123456789"
+
+
+class Anonymizer:
+    """Rewrites everything that identifies a user or says what they wrote,
+    keeping what the server's work depends on: which user talks to whom,
+    frame sizes, repeated words (so searches still hit), message ids and
+    file transfer ids."""
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+        self.nicknames = {}
+        self.passwords = {}
+        self.words = {}
+        self.file_names = {}
+
+    def nick(self, nickname):
+        if nickname not in self.nicknames:
+            self.nicknames[nickname] = f"user{len(self.nicknames) + 1}"
+        return self.nicknames[nickname]
+
+    def password(self, nickname, password):
+        key = (nickname, password)
+        if key not in self.passwords:
+            self.passwords[key] = f"pass{len(self.passwords) + 1}"
+        return self.passwords[key]
+
+    def word(self, word):
+        key = word.lower()
+        if key not in self.words:
+            replacement = []
+            for char in key:
+                if char.isdigit():
+                    pool = DIGITS
+                else:
+                    pool = FILLERS.get(len(char.encode("utf-8")), FILLERS[1])
+                replacement.append(self.random.choice(pool))
+            self.words[key] = "".join(replacement)
+        return self.words[key]
+
+    def text(self, text):
+        """Replaces every run of letters and digits, keeps spacing and
+        punctuation."""
+        out = []
+        run = []
+        for char in text + " ":
+            if char.isalnum():
+                run.append(char)
+                continue
+            if run:
+                out.append(self.word("".join(run)))
+                run = []
+            out.append(char)
+        return "".join(out)[:-1]
+
+    def file_name(self, name):
+        if name not in self.file_names:
+            extension = os.path.splitext(name)[1]
+            if not extension[1:].isalnum():
+                extension = ""
+            self.file_names[name] = f"file{len(self.file_names) + 1}{extension}"
+        return self.file_names[name]
+
+    def auth_line(self, line):
+        if line.startswith(MessageProtocol.CMD_RESUME + " "):
+            nickname = decode_resume_token(line[len(MessageProtocol.CMD_RESUME) + 1 :])
+            if nickname is None:
+                return MessageProtocol.CMD_RESUME + " " + fake_resume_token("")
+            return (
+                MessageProtocol.CMD_RESUME
+                + " "
+                + fake_resume_token(self.nick(nickname))
+            )
+
+        parts = line.split(" ", 1)
+        if len(parts) != 2:
+            return self.text(line)
+        nickname, password = parts
+        return f"{self.nick(nickname)} {self.password(nickname, password)}"
+
+    def command(self, line):
+        msg_id, wants_receipt, line = MessageProtocol.split_message_id(line)
+        line = self._command(line)
+        if msg_id is None:
+            return line
+        return f"{MessageProtocol.MESSAGE_ID_CMD}{msg_id}{'!' if wants_receipt else ''} {line}"
+
+    def _command(self, line):
+        if not line.startswith("/"):
+            return self.text(line)
+
+        command, _, rest = line.partition(" ")
+        name = command[1:].upper()
+
+        if name == "MSG":
+            target, _, content = rest.partition(" ")
+            return f"{command} {self.nick(target)} {self.text(content)}".rstrip()
+
+        if name == "RECEIPT":
+            sender, _, msg_id = rest.partition(" ")
+            return f"{command} {self.nick(sender)} {msg_id}"
+
+        if name == "SEARCH":
+            terms = []
+            for term in rest.split(" "):
+                if term.lower().startswith("with:"):
+                    terms.append(term[:5] + self.nick(term[5:]))
+                else:
+                    terms.append(self.text(term))
+            return f"{command} {' '.join(terms)}"
+
+        if name == "FILE":
+            action, _, args = rest.partition(" ")
+            if action.lower() == "offer":
+                parts = args.split(" ", 3)
+                if len(parts) == 4:
+                    transfer_id, recipient, size, file_name = parts
+                    return (
+                        f"{command} {action} {transfer_id} {self.nick(recipient)} "
+                        f"{size} {self.file_name(file_name)}"
+                    )
+            if action.lower() in ("chunk", "ack", "accept", "end", "reject", "cancel"):
+                return line
+            return f"{command} {self.text(rest)}"
+
+        if name in ("LIST", "EXIT"):
+            return line
+        return f"{command} {self.text(rest)}".rstrip()
+
+    def frame(self, kind, frame):
+        line = frame.decode(MessageProtocol.ENCODING, errors="replace")
+        stripped = line.rstrip("\r")
+        ending = line[len(stripped) :]
+        if not stripped.strip():
+            return frame
+        if kind == AUTH_FRAME:
+            stripped = self.auth_line(stripped)
+        else:
+            stripped = self.command(stripped)
+        return (stripped + ending).encode(MessageProtocol.ENCODING)
+
+    def records(self, records):
+        for kind, conn_id, seconds, data in records:
+            if kind in (FRAME, AUTH_FRAME):
+                data = self.frame(kind, data)
+            elif kind == PAYLOAD:
+                data = bytes(len(data))
+            elif kind in (OPEN, CLOSE):
+                data = b""
+            yield kind, conn_id, seconds, data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Strip nicknames, passwords, message text and file contents "
+        "from a traffic capture so it can be shared."
+    )
+    parser.add_argument("capture")
+    parser.add_argument("output")
+    parser.add_argument(
+        "--seed", type=int, help="Makes the replacement words reproducible."
+    )
+    args = parser.parse_args()
+
+    anonymizer = Anonymizer(args.seed)
+    count = write_capture(args.output, anonymizer.records(read_capture(args.capture)))
+    print(
+        f"Wrote {count} records for {len(anonymizer.nicknames)} users "
+        f"to {args.output}"
+    )
@@ -0,0 +1,176 @@
+import sys
+import os
+import time
+import socket
+import argparse
+import selectors
+import threading
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.protocol import MessageProtocol
+from core.server_classes import ClientHandler
+
+
+class CountingSocket(socket.socket):
+    """Counts the send calls a handler makes on its connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def sendall(self, data, *args):
+        self.calls += 1
+        return super().sendall(data, *args)
+
+    def sendmsg(self, buffers, *args):
+        self.calls += 1
+        return super().sendmsg(buffers, *args)
+
+
+class LegacyHandler(ClientHandler):
+    """The previous send path: one locked sendall per frame."""
+
+    def send_frames(self, *buffers):
+        with self.flush_lock:
+            for data in buffers:
+                self.socket.sendall(data)
+
+
+def open_connections(count, args):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(count)
+
+    pairs = []
+    for _ in range(count):
+        client = socket.create_connection(listener.getsockname())
+        if args.rcvbuf:
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.rcvbuf)
+        accepted, _ = listener.accept()
+        server_side = CountingSocket(fileno=accepted.detach())
+        server_side.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, int(args.nodelay)
+        )
+        if args.sndbuf:
+            server_side.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, args.sndbuf)
+        pairs.append((server_side, client))
+    listener.close()
+    return pairs
+
+
+def drain(clients, expected, done):
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client, selectors.EVENT_READ)
+
+    received = 0
+    while received < expected:
+        for key, _ in selector.select(timeout=1.0):
+            data = key.fileobj.recv(256 * 1024)
+            received += len(data)
+    selector.close()
+    done.set()
+
+
+def run(mode, args):
+    handler_class = LegacyHandler if mode == "sendall" else ClientHandler
+    server = SimpleNamespace(
+        logger=SimpleNamespace(log_event=lambda level, message: print(message)),
+        release_client=lambda handler: None,
+        connections=set(),
+        capture=None,
+    )
+
+    pairs = open_connections(args.receivers, args)
+    handlers = []
+    for index, (server_side, _) in enumerate(pairs):
+        handler = handler_class(server_side, ("127.0.0.1", index), server)
+        handler.nickname = f"bench{index}"
+        handlers.append(handler)
+
+    frames = [
+        MessageProtocol.encode_message(
+            MessageProtocol.TYPE_PUBLIC,
+            {"sender": "bench", "content": "[12:00:00] <bench>: " + "x" * args.size},
+        )
+    ] * args.burst
+    total_frames = args.senders * args.messages * args.receivers * args.burst
+    done = threading.Event()
+    reader = threading.Thread(
+        target=drain,
+        args=([client for _, client in pairs], total_frames * len(frames[0]), done),
+        daemon=True,
+    )
+    reader.start()
+
+    def broadcast():
+        for _ in range(args.messages):
+            for handler in handlers:
+                handler.send_frames(*frames)
+
+    started = time.perf_counter()
+    senders = [threading.Thread(target=broadcast) for _ in range(args.senders)]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    done.wait()
+    elapsed = time.perf_counter() - started
+
+    calls = sum(server_side.calls for server_side, _ in pairs)
+    for server_side, client in pairs:
+        server_side.close()
+        client.close()
+
+    return {
+        "mode": mode,
+        "frames": total_frames,
+        "seconds": elapsed,
+        "frames_per_sec": total_frames / elapsed,
+        "calls": calls,
+        "calls_per_frame": calls / total_frames,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare per-frame sendall with coalesced sendmsg fan-out."
+    )
+    parser.add_argument("--receivers", type=int, default=50)
+    parser.add_argument(
+        "--senders", type=int, default=8, help="Concurrent broadcasting threads."
+    )
+    parser.add_argument(
+        "--messages", type=int, default=500, help="Broadcasts per sender."
+    )
+    parser.add_argument("--size", type=int, default=80, help="Message text length.")
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        help="Frames per event, e.g. 2 for a leave notice plus list update.",
+    )
+    parser.add_argument("--nodelay", type=int, choices=(0, 1), default=1)
+    parser.add_argument("--sndbuf", type=int, default=0)
+    parser.add_argument("--rcvbuf", type=int, default=0)
+    parser.add_argument(
+        "--mode", choices=("both", "sendall", "sendmsg"), default="both"
+    )
+    args = parser.parse_args()
+
+    modes = ["sendall", "sendmsg"] if args.mode == "both" else [args.mode]
+    print(
+        f"{args.receivers} receivers, {args.senders} senders x {args.messages} "
+        f"broadcasts of {args.burst} frame(s), TCP_NODELAY={args.nodelay}"
+    )
+    print("-" * 64)
+    for mode in modes:
+        result = run(mode, args)
+        print(
+            f"{result['mode']:>8}: {result['frames']} frames in "
+            f"{result['seconds']:.2f}s ({result['frames_per_sec']:,.0f} frames/s), "
+            f"{result['calls']} send calls ({result['calls_per_frame']:.3f}/frame)"
+        )
+    print("-" * 64)
@@ -0,0 +1,245 @@
+import sys
+import os
+import time
+import json
+import random
+import argparse
+import platform
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.protocol import MessageProtocol, FrameBuffer
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "protocol.json")
+DEFAULT_THRESHOLD = 1.25
+
+WORDS = (
+    "hello world selam nasılsın merhaba günaydın ok yes no lol meeting "
+    "tomorrow ödev proje sunucu istemci şimdi 👍 🎉 çok güzel banana"
+).split()
+
+# (weight, min length, max length) of chat message text.
+DISTRIBUTIONS = {
+    "short": [(1.0, 1, 40)],
+    "mixed": [(0.6, 1, 40), (0.3, 40, 200), (0.09, 200, 2000), (0.01, 2000, 16000)],
+    "large": [(1.0, 2000, 30000)],
+}
+
+
+def make_text(rng, length):
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def make_corpus(name, count, seed):
+    rng = random.Random(f"{seed}:{name}")
+    buckets = DISTRIBUTIONS[name]
+    weights = [bucket[0] for bucket in buckets]
+    texts = []
+    for _ in range(count):
+        _, low, high = rng.choices(buckets, weights)[0]
+        texts.append(make_text(rng, rng.randint(low, high)))
+    return rng, texts
+
+
+def build_cases(name, count, seed):
+    rng, texts = make_corpus(name, count, seed)
+    nicks = [f"user{i}" for i in range(50)]
+
+    payloads = []
+    commands = []
+    for text in texts:
+        nick = rng.choice(nicks)
+        kind = rng.random()
+        if kind < 0.7:
+            payloads.append(
+                (
+                    MessageProtocol.TYPE_PUBLIC,
+                    {"sender": nick, "content": f"[12:00:00] <{nick}>: {text}"},
+                )
+            )
+            commands.append(text)
+        elif kind < 0.95:
+            payloads.append(
+                (
+                    MessageProtocol.TYPE_PRIVATE,
+                    {
+                        "sender": nick,
+                        "content": f"[12:00:00] [PRIVATE from {nick}]: {text}",
+                    },
+                )
+            )
+            commands.append(f"/msg {rng.choice(nicks)} {text}")
+        else:
+            users = rng.sample(nicks, rng.randint(1, len(nicks)))
+            payloads.append(
+                (MessageProtocol.TYPE_LIST, {"users": users, "count": len(users)})
+            )
+            commands.append(rng.choice(["/list", f"/search {text[:40]}"]))
+
+    frames = [MessageProtocol.encode_message(*payload) for payload in payloads]
+    decoded = [frame[:-1] for frame in frames]
+    stream = b"".join(
+        command.encode(MessageProtocol.ENCODING) + b"\n" for command in commands
+    )
+    reads = [stream[i : i + 4096] for i in range(0, len(stream), 4096)]
+
+    def feed_all():
+        buffer = FrameBuffer()
+        for data in reads:
+            buffer.feed(data)
+
+    return {
+        "encode_message": (
+            lambda item: MessageProtocol.encode_message(*item),
+            payloads,
+        ),
+        "decode_message": (MessageProtocol.decode_message, decoded),
+        "parse_client_command": (MessageProtocol.parse_client_command, commands),
+        # One op is one client command, fed in 4096-byte reads.
+        "FrameBuffer.feed": (lambda _: feed_all(), [None], len(commands)),
+    }
+
+
+def time_case(func, items, ops, repeat, min_time):
+    """Best of repeat runs; each run loops over the corpus for at least
+    min_time seconds so short cases are not dominated by timer noise."""
+    loops = 1
+    while True:
+        started = time.perf_counter_ns()
+        for _ in range(loops):
+            for item in items:
+                func(item)
+        elapsed = time.perf_counter_ns() - started
+        if elapsed >= min_time * 1e9:
+            break
+        loops *= 2
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        started = time.perf_counter_ns()
+        for _ in range(loops):
+            for item in items:
+                func(item)
+        best = min(best, time.perf_counter_ns() - started)
+    return best / (ops * loops)
+
+
+def alloc_case(func, items, ops, sample):
+    """Average peak of traced allocations per op, over a sample of items."""
+    if len(items) > sample:
+        items, ops = items[:sample], sample
+    total = 0
+    tracemalloc.start()
+    try:
+        for item in items:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            func(item)
+            total += tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return total / ops
+
+
+def run(args):
+    results = {}
+    for dist in args.distributions:
+        for name, case in build_cases(dist, args.count, args.seed).items():
+            func, items = case[0], case[1]
+            ops = case[2] if len(case) > 2 else len(items)
+            key = f"{name}/{dist}"
+            results[key] = {
+                "ns_per_op": round(
+                    time_case(func, items, ops, args.repeat, args.min_time), 1
+                ),
+                "alloc_bytes_per_op": round(
+                    alloc_case(func, items, ops, args.alloc_sample), 1
+                ),
+            }
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"{'benchmark':<34}{'ns/op':>12}{'baseline':>12}{'ratio':>8}{'B/op':>10}")
+    print("-" * 76)
+    for key, result in results.items():
+        base = baseline.get(key, {}).get("ns_per_op")
+        ratio = result["ns_per_op"] / base if base else None
+        flag = ""
+        if ratio is not None and ratio > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(
+            f"{key:<34}{result['ns_per_op']:>12,.0f}"
+            f"{(f'{base:,.0f}' if base else '-'):>12}"
+            f"{(f'{ratio:.2f}' if ratio else '-'):>8}"
+            f"{result['alloc_bytes_per_op']:>10,.0f}{flag}"
+        )
+    print("-" * 76)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks for MessageProtocol and FrameBuffer."
+    )
+    parser.add_argument(
+        "--distributions",
+        nargs="+",
+        choices=sorted(DISTRIBUTIONS),
+        default=["short", "mixed", "large"],
+    )
+    parser.add_argument("--count", type=int, default=1000, help="Messages per corpus.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-time", type=float, default=0.1, help="Seconds per timed run."
+    )
+    parser.add_argument("--alloc-sample", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Fail when ns/op exceeds baseline by this factor.",
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results = run(args)
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "count": args.count,
+                    "seed": args.seed,
+                    "results": dict(baseline, **results),
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif regressions:
+        print(
+            f"{len(regressions)} benchmark(s) slower than {args.threshold}x baseline."
+        )
+        sys.exit(1)
@@ -0,0 +1,100 @@
+import sys
+import os
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+WEB_MODULES = ("websockets", "http.server", "core.web_server")
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import core.server_classes
+if {web}:
+    import core.web_server
+elapsed = time.perf_counter() - started
+leaked = [name for name in {modules!r} if name in sys.modules]
+print(elapsed, ",".join(leaked))
+"""
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(web):
+    """Imports the server in a fresh interpreter, so nothing is cached."""
+    script = IMPORT_SCRIPT.format(root=ROOT, web=web, modules=WEB_MODULES)
+    output = subprocess.check_output([sys.executable, "-c", script], text=True)
+    elapsed, leaked = output.strip().partition(" ")[::2]
+    if not web and leaked:
+        raise RuntimeError(f"Headless import pulled in: {leaked}")
+    return float(elapsed)
+
+
+def measure_startup(headless, timeout):
+    """Time from spawning chat_server.py until the chat port accepts and
+    sends its first AUTH request."""
+    port = free_port()
+    command = [sys.executable, os.path.join(ROOT, "chat_server.py"), str(port)]
+    if headless:
+        command.append("--headless")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            cwd=workdir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            deadline = started + timeout
+            while time.perf_counter() < deadline:
+                try:
+                    with socket.create_connection(("127.0.0.1", port), 0.5) as sock:
+                        sock.settimeout(timeout)
+                        if sock.recv(64):
+                            return time.perf_counter() - started
+                except OSError:
+                    time.sleep(0.002)
+            raise RuntimeError(f"Server did not start within {timeout}s")
+        finally:
+            process.kill()
+            process.wait()
+
+
+def summarize(samples):
+    return statistics.median(samples) * 1000, min(samples) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare import and startup time of headless and web mode."
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    # The web monitor binds the default HTTP/WebSocket ports, so web mode
+    # startup can only be measured while 8000 and 8001 are free.
+    cases = [
+        ("import headless", lambda: measure_import(False)),
+        ("import with web", lambda: measure_import(True)),
+        ("startup headless", lambda: measure_startup(True, args.timeout)),
+        ("startup with web", lambda: measure_startup(False, args.timeout)),
+    ]
+
+    print(f"{'case':<20}{'median ms':>12}{'min ms':>10}")
+    print("-" * 42)
+    for name, measure in cases:
+        median, best = summarize([measure() for _ in range(args.runs)])
+        print(f"{name:<20}{median:>12.1f}{best:>10.1f}")
+    print("-" * 42)
@@ -0,0 +1,404 @@
+import sys
+import os
+import time
+import random
+import argparse
+import traceback
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.protocol import MessageProtocol, FrameBuffer
+
+MESSAGE_TYPES = [
+    value
+    for name, value in vars(MessageProtocol).items()
+    if name.startswith("TYPE_") and value != MessageProtocol.TYPE_FILE_CHUNK
+]
+CLIENT_TYPES = {
+    MessageProtocol.TYPE_PUBLIC,
+    MessageProtocol.TYPE_PRIVATE,
+    MessageProtocol.TYPE_LIST_REQ,
+    MessageProtocol.TYPE_SEARCH_REQ,
+    MessageProtocol.TYPE_FILE_REQ,
+    MessageProtocol.TYPE_RECEIPT,
+    MessageProtocol.CMD_EXIT,
+    "UNKNOWN_CMD",
+}
+ALPHABET = "abcXYZ019 !_-|/\\\"'{}[]:,\t\r\n\x00ıİşçöüğ€😀​\U0010fffd"
+COMMANDS = [
+    "/msg",
+    "/MSG",
+    "/list",
+    "/search",
+    "/file",
+    "/receipt",
+    "/mid",
+    "/exit",
+    "/",
+    "//",
+    "/x",
+]
+MESSAGE_ID_CHARS = "abcXYZ019_-"
+
+
+class FuzzFailure(Exception):
+    pass
+
+
+def random_text(rng, max_length):
+    length = min(int(rng.expovariate(1 / 40)), max_length)
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(7 if depth < 3 else 4)
+    if kind == 0:
+        return random_text(rng, 200)
+    if kind == 1:
+        return rng.randint(-(2**63), 2**63)
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind == 3:
+        return rng.uniform(-1e9, 1e9)
+    if kind in (4, 5):
+        return {
+            random_text(rng, 20): random_value(rng, depth + 1)
+            for _ in range(rng.randrange(5))
+        }
+    return [random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+
+
+def random_command(rng):
+    kind = rng.random()
+    if kind < 0.3:
+        return random_text(rng, 500)
+    parts = [rng.choice(COMMANDS)]
+    for _ in range(rng.randrange(4)):
+        parts.append(random_text(rng, 60))
+    return rng.choice([" ", "  ", "\t"]).join(parts)
+
+
+def random_bytes(rng, max_length):
+    length = min(int(rng.expovariate(1 / 64)), max_length)
+    return bytes(rng.getrandbits(8) for _ in range(length))
+
+
+def chunk_header(rng, prefix, size):
+    """A valid chunk header as a client (FILE_CHUNK_CMD) or the server
+    (FILE_CHUNK_HEADER) sends it, without the delimiter."""
+    transfer_id = "%016x" % rng.getrandbits(64)
+    if prefix == MessageProtocol.FILE_CHUNK_CMD:
+        header = MessageProtocol.encode_chunk_header(
+            transfer_id, rng.randrange(100), size
+        )
+    else:
+        header = MessageProtocol.encode_message(
+            MessageProtocol.TYPE_FILE_CHUNK,
+            {"id": transfer_id, "seq": rng.randrange(100), "size": size},
+        )
+    return header[:-1]
+
+
+def bad_chunk_header(rng, prefix):
+    """A chunk header whose size FrameBuffer must refuse."""
+    size = rng.choice(
+        [
+            "",
+            "-1",
+            "x",
+            "1.5",
+            "1e3",
+            str(MessageProtocol.MAX_CHUNK_SIZE + 1),
+            str(MessageProtocol.MAX_CHUNK_SIZE + rng.randint(1, 2**40)),
+        ]
+    )
+    if prefix == MessageProtocol.FILE_CHUNK_CMD:
+        parts = ["t%x" % rng.getrandbits(32), str(rng.randrange(100)), size]
+        if rng.random() < 0.3:
+            parts = random_text(rng, 40).replace("\n", " ").split(" ")[:6]
+        return MessageProtocol.FILE_CHUNK_CMD + " ".join(parts).encode()
+    body = rng.choice(
+        [
+            '{"size": %s}' % (size or "null"),
+            '{"size": "%s"}' % size,
+            "[1, 2]",
+            "not json",
+            "[" * 2000,
+        ]
+    )
+    return MessageProtocol.FILE_CHUNK_HEADER + body.encode()
+
+
+def split_points(rng, data):
+    """Cuts data into random reads, often in the middle of a UTF-8 sequence."""
+    reads = []
+    start = 0
+    while start < len(data):
+        size = rng.choice([1, 2, 3, rng.randint(1, 64), rng.randint(1, 4096)])
+        reads.append(data[start : start + size])
+        start += size
+    return reads
+
+
+def bounded(limit, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    if elapsed > limit:
+        raise FuzzFailure(
+            f"{getattr(func, '__qualname__', func)} took {elapsed * 1000:.1f}ms"
+        )
+    return result
+
+
+def check_message_roundtrip(rng, limit):
+    msg_type = rng.choice(MESSAGE_TYPES)
+    data = {random_text(rng, 20): random_value(rng) for _ in range(rng.randrange(6))}
+
+    frame = bounded(limit, MessageProtocol.encode_message, msg_type, data)
+    if not frame.endswith(b"\n") or frame.count(b"\n") != 1:
+        raise FuzzFailure(f"encoded frame is not a single line: {frame[:80]!r}")
+
+    decoded = bounded(limit, MessageProtocol.decode_message, frame[:-1])
+    if decoded != (msg_type, data):
+        raise FuzzFailure(f"round trip mismatch for {msg_type}: {decoded!r}")
+
+
+def check_decode_garbage(rng, limit):
+    data = random_bytes(rng, 2048)
+    if rng.random() < 0.5:
+        data = rng.choice(MESSAGE_TYPES).encode() + b"|" + data
+    msg_type, payload = bounded(limit, MessageProtocol.decode_message, data)
+    if msg_type is not None and not isinstance(msg_type, str):
+        raise FuzzFailure(f"decode_message returned type {msg_type!r}")
+
+
+def check_parse_command(rng, limit):
+    line = random_command(rng)
+    msg_type, target, content = bounded(
+        limit, MessageProtocol.parse_client_command, line
+    )
+    if msg_type not in CLIENT_TYPES:
+        raise FuzzFailure(f"unexpected command type {msg_type!r} for {line!r}")
+
+    nick = "user" + str(rng.randrange(1000))
+    text = random_text(rng, 300).strip()
+    if text:
+        parsed = MessageProtocol.parse_client_command(f"/msg {nick} {text}")
+        if parsed != (MessageProtocol.TYPE_PRIVATE, nick, text):
+            raise FuzzFailure(f"/msg did not round trip: {parsed!r}")
+
+    msg_id = random_message_id(rng)
+    parsed = MessageProtocol.parse_client_command(f"/receipt {nick} {msg_id}")
+    if parsed != (MessageProtocol.TYPE_RECEIPT, nick, msg_id):
+        raise FuzzFailure(f"/receipt did not round trip: {parsed!r}")
+
+
+def random_message_id(rng):
+    return "".join(rng.choice(MESSAGE_ID_CHARS) for _ in range(rng.randint(1, 32)))
+
+
+def check_message_id(rng, limit):
+    line = random_command(rng)
+    if rng.random() < 0.7:
+        line = f"{MessageProtocol.MESSAGE_ID_CMD}{random_text(rng, 40)} {line}"
+    msg_id, wants_receipt, rest = bounded(limit, MessageProtocol.split_message_id, line)
+    if msg_id is None:
+        if (wants_receipt, rest) != (False, line):
+            raise FuzzFailure(f"untagged line was changed: {line!r}")
+    elif (
+        not MessageProtocol.MESSAGE_ID_RE.match(msg_id)
+        or line
+        != f"{MessageProtocol.MESSAGE_ID_CMD}{msg_id}{'!' * wants_receipt} {rest}"
+    ):
+        raise FuzzFailure(f"split_message_id({line!r}) returned {msg_id!r}")
+
+    msg_id = random_message_id(rng)
+    wants_receipt = rng.random() < 0.5
+    text = random_command(rng)
+    tagged = f"{MessageProtocol.MESSAGE_ID_CMD}{msg_id}{'!' * wants_receipt} {text}"
+    parsed = MessageProtocol.split_message_id(tagged)
+    if parsed != (msg_id, wants_receipt, text):
+        raise FuzzFailure(f"/mid did not round trip: {parsed!r}")
+
+
+def check_frame_buffer(rng, limit):
+    # Either side's buffer; the other side's chunk headers are plain lines.
+    prefix, other = rng.choice(
+        [
+            (MessageProtocol.FILE_CHUNK_CMD, MessageProtocol.FILE_CHUNK_HEADER),
+            (MessageProtocol.FILE_CHUNK_HEADER, MessageProtocol.FILE_CHUNK_CMD),
+        ]
+    )
+    expected = []
+    stream = []
+    refused = False
+    for _ in range(rng.randrange(1, 20)):
+        if rng.random() < 0.2:
+            payload = random_bytes(rng, 3000)
+            header = chunk_header(rng, prefix, len(payload))
+            expected.append((header, payload))
+            stream += [header, b"\n", payload]
+            continue
+
+        kind = rng.random()
+        if kind < 0.05:
+            line = bad_chunk_header(rng, prefix)
+        elif kind < 0.15:
+            line = rng.choice(
+                [bad_chunk_header(rng, other), chunk_header(rng, other, 10)]
+            )
+        elif kind < 0.4:
+            line = random_bytes(rng, 500).replace(b"\n", b"")
+        else:
+            line = random_command(rng).replace("\n", " ").encode()
+        try:
+            if MessageProtocol.payload_length(line, prefix) is not None:
+                # A random line that happens to be a valid chunk header.
+                continue
+        except ValueError:
+            # Nothing after a bad chunk header may come out as a frame.
+            refused = True
+            stream += [line, b"\n", b"/msg bob payload\n" * rng.randrange(3)]
+            break
+        expected.append((line, None))
+        stream += [line, b"\n"]
+
+    buffer = FrameBuffer(chunk_prefix=prefix)
+    frames = []
+    try:
+        for data in split_points(rng, b"".join(stream)):
+            frames += bounded(limit, buffer.feed, data)
+    except ValueError:
+        if not refused:
+            raise FuzzFailure("FrameBuffer refused a well-formed stream")
+    else:
+        if refused:
+            raise FuzzFailure("FrameBuffer accepted a bad chunk header")
+    if frames != expected[: len(frames)] or not refused and frames != expected:
+        raise FuzzFailure("FrameBuffer did not reassemble the stream")
+    if not refused and (buffer.buffer or buffer.chunk_header is not None):
+        raise FuzzFailure("FrameBuffer kept data after a complete stream")
+
+
+ADVERSARIAL = [
+    ("long /msg line", lambda: "/msg bob " + "x" * 60000),
+    ("only spaces", lambda: " " * 60000),
+    ("many slashes", lambda: "/" * 60000),
+    ("many words", lambda: "/search " + "a " * 30000),
+    ("nested json", lambda: "PUBLIC|" + "[" * 60000),
+    ("nested objects", lambda: "PUBLIC|" + '{"a":' * 20000),
+    ("huge number", lambda: "PUBLIC|" + "9" * 60000),
+    ("chunk header json", lambda: "FILE_CHUNK|" + "[" * 60000),
+    ("chunk header no size", lambda: "/file chunk hello"),
+    ("chunk header huge size", lambda: "/file chunk t1 0 " + "9" * 60000),
+    (
+        "chunk header size over max",
+        lambda: f"/file chunk deadbeef00 0 {MessageProtocol.MAX_CHUNK_SIZE + 1}",
+    ),
+    ("chunk header negative", lambda: 'FILE_CHUNK|{"size": -1}'),
+]
+
+
+def check_adversarial(line, limit, total_limit):
+    data = line.encode(MessageProtocol.ENCODING)
+    try:
+        bounded(limit, MessageProtocol.parse_client_command, line)
+        bounded(limit, MessageProtocol.decode_message, data)
+    except FuzzFailure:
+        raise
+    except Exception as e:
+        raise FuzzFailure(f"{type(e).__name__}: {e}")
+
+    # The server side: the whole line arrives one byte at a time. A line
+    # over MAX_FRAME_SIZE and a bad /file chunk header must be refused;
+    # anything else, FILE_CHUNK| text included, is one ordinary frame.
+    refused = len(data) > MessageProtocol.MAX_FRAME_SIZE or data.startswith(
+        MessageProtocol.FILE_CHUNK_CMD
+    )
+    buffer = FrameBuffer()
+    frames = []
+    started = time.perf_counter()
+    try:
+        for i in range(len(data)):
+            frames += buffer.feed(data[i : i + 1])
+        frames += buffer.feed(b"\n")
+    except ValueError as e:
+        if not refused:
+            raise FuzzFailure(f"FrameBuffer raised ValueError: {e}")
+    except Exception as e:
+        raise FuzzFailure(f"FrameBuffer raised {type(e).__name__}: {e}")
+    else:
+        if refused:
+            raise FuzzFailure("FrameBuffer accepted the line")
+    elapsed = time.perf_counter() - started
+    if elapsed > total_limit:
+        raise FuzzFailure(f"byte-by-byte FrameBuffer took {elapsed * 1000:.0f}ms")
+    if not refused and frames != [(data, None)]:
+        raise FuzzFailure("FrameBuffer did not return the line as one frame")
+
+
+CHECKS = [
+    check_message_roundtrip,
+    check_decode_garbage,
+    check_parse_command,
+    check_message_id,
+    check_frame_buffer,
+]
+
+
+def run(args):
+    limit = args.time_limit_ms / 1000
+    failures = 0
+    cases = 0
+
+    for name, build in ADVERSARIAL:
+        try:
+            check_adversarial(build(), limit, args.stream_limit_ms / 1000)
+        except FuzzFailure as e:
+            failures += 1
+            print(f"[FAIL] adversarial '{name}': {e}")
+
+    for iteration in range(args.iterations):
+        seed = f"{args.seed}:{iteration}"
+        check = CHECKS[iteration % len(CHECKS)]
+        try:
+            check(random.Random(seed), limit)
+        except FuzzFailure as e:
+            failures += 1
+            print(f"[FAIL] {check.__name__} seed={seed}: {e}")
+        except Exception:
+            failures += 1
+            print(f"[FAIL] {check.__name__} seed={seed} raised:")
+            traceback.print_exc()
+        cases += 1
+        if failures >= args.max_failures:
+            break
+
+    print(f"{cases} cases, {failures} failure(s).")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fuzz MessageProtocol and FrameBuffer with random input."
+    )
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--seed", default=str(int(time.time())))
+    parser.add_argument(
+        "--time-limit-ms",
+        type=float,
+        default=50.0,
+        help="Maximum time for a single call.",
+    )
+    parser.add_argument(
+        "--stream-limit-ms",
+        type=float,
+        default=2000.0,
+        help="Maximum time to feed a 60KB line one byte at a time.",
+    )
+    parser.add_argument("--max-failures", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"Seed: {args.seed}")
+    sys.exit(1 if run(args) else 0)
@@ -0,0 +1,124 @@
+import sys
+import os
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.async_client import (
+    AsyncChatClient,
+    EVENT_DISCONNECTED,
+    EVENT_RECONNECTED,
+)
+
+
+class LoadStats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.sent = 0
+        self.received = 0
+        self.disconnects = 0
+        self.reconnects = 0
+
+
+def raise_fd_limit():
+    try:
+        import resource
+
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+async def consume(client, stats):
+    async for msg_type, data in client:
+        if msg_type == EVENT_DISCONNECTED:
+            stats.disconnects += 1
+        elif msg_type == EVENT_RECONNECTED:
+            stats.reconnects += 1
+        else:
+            stats.received += 1
+
+
+async def run_client(index, args, stats, deadline):
+    nickname = f"{args.prefix}{index}"
+    client = AsyncChatClient(args.host, args.port)
+    try:
+        await client.connect(nickname, args.password)
+    except Exception:
+        stats.failed += 1
+        return
+    stats.connected += 1
+
+    consumer = asyncio.get_running_loop().create_task(consume(client, stats))
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(random.expovariate(args.rate))
+            if random.random() < args.private_ratio:
+                target = f"{args.prefix}{random.randrange(args.clients)}"
+                await client.send_private(target, f"load message {stats.sent}")
+            else:
+                await client.send_public(f"load message {stats.sent}")
+            stats.sent += 1
+    finally:
+        await client.close()
+        consumer.cancel()
+
+
+async def report(stats, interval):
+    started = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        elapsed = time.monotonic() - started
+        print(
+            f"[{elapsed:6.1f}s] connected={stats.connected} failed={stats.failed} "
+            f"sent={stats.sent} received={stats.received} "
+            f"disconnects={stats.disconnects} reconnects={stats.reconnects}"
+        )
+
+
+async def main(args):
+    stats = LoadStats()
+    deadline = time.monotonic() + args.duration
+    reporter = asyncio.get_running_loop().create_task(report(stats, args.report_every))
+
+    tasks = []
+    for index in range(args.clients):
+        tasks.append(asyncio.create_task(run_client(index, args, stats, deadline)))
+        await asyncio.sleep(1 / args.connect_rate)
+
+    await asyncio.gather(*tasks)
+    reporter.cancel()
+
+    print("-" * 40)
+    print(
+        f"Clients: {stats.connected} connected, {stats.failed} failed\n"
+        f"Messages: {stats.sent} sent, {stats.received} frames received\n"
+        f"Disconnects: {stats.disconnects}, reconnects: {stats.reconnects}"
+    )
+    print("-" * 40)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive many chat clients at once.")
+    parser.add_argument("host", nargs="?", default="127.0.0.1")
+    parser.add_argument("port", nargs="?", type=int, default=9999)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument(
+        "--rate", type=float, default=0.5, help="Messages per second per client."
+    )
+    parser.add_argument("--private-ratio", type=float, default=0.2)
+    parser.add_argument(
+        "--connect-rate", type=float, default=200.0, help="New clients per second."
+    )
+    parser.add_argument("--prefix", default="load")
+    parser.add_argument("--password", default="loadpass")
+    parser.add_argument("--report-every", type=float, default=5.0)
+
+    raise_fd_limit()
+    asyncio.run(main(parser.parse_args()))
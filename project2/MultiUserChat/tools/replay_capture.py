@@ -0,0 +1,371 @@
+import sys
+import os
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict, deque
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from core.protocol import MessageProtocol, FrameBuffer
+from core.traffic_capture import (
+    OPEN,
+    FRAME,
+    AUTH_FRAME,
+    PAYLOAD,
+    CLOSE,
+    decode_resume_token,
+    read_capture,
+)
+from load_generator import raise_fd_limit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FALLBACK_PASSWORD = "replay"
+PRIVATE_NOTICES = ("[Private message sent to", "Warning: User", "Error: User")
+RATE_LIMIT_WARNING = "WARNING: Message rate limit exceeded."
+
+SERVER_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+from core.server_classes import ChatServer
+server = ChatServer(host="127.0.0.1", chat_port={port}, headless=True)
+if {no_rate_limit}:
+    server.rate_limiter.max_messages = 10 ** 9
+server.start()
+"""
+
+
+class ReplayStats:
+    def __init__(self):
+        self.connections = 0
+        self.failed = 0
+        self.reset = 0
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.received_frames = 0
+        self.received_bytes = 0
+        self.auth_failures = 0
+        self.rate_limited = 0
+        self.unanswered = 0
+        self.latency = defaultdict(list)
+        self.lag = []
+
+
+def load_capture(path):
+    """Groups records by connection and works out a password for every
+    nickname, so resume tokens, which only the capturing server could
+    verify, can be replayed as plain logins."""
+    connections = defaultdict(list)
+    passwords = {}
+    for kind, conn_id, seconds, data in read_capture(path):
+        connections[conn_id].append((kind, seconds, data))
+        if kind == AUTH_FRAME:
+            line = data.decode(MessageProtocol.ENCODING, errors="replace").strip()
+            parts = line.split(" ", 1)
+            if len(parts) == 2 and not line.startswith(
+                ("/", MessageProtocol.CMD_RESUME)
+            ):
+                # The first login on a fresh server registers the nickname.
+                passwords.setdefault(parts[0], parts[1])
+    return connections, passwords
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class ReplayConnection:
+    """Replays one captured connection and times the server's answers.
+
+    Tagged (/mid) messages are timed to their ACK, untagged public
+    messages to their own echo and untagged private messages to the
+    "sent" notice. Logins are timed to AUTH_SUCCESS.
+    """
+
+    def __init__(self, records, passwords, stats):
+        self.records = records
+        self.passwords = passwords
+        self.stats = stats
+        self.nickname = None
+        self.logins = deque()
+        self.acks = {}
+        self.echoes = defaultdict(deque)
+        self.private = deque()
+        self.buffer = FrameBuffer(
+            max_frame_size=1 << 24, chunk_prefix=MessageProtocol.FILE_CHUNK_HEADER
+        )
+
+    def pending(self):
+        return bool(
+            self.logins or self.acks or self.private or any(self.echoes.values())
+        )
+
+    def _prepare(self, kind, data, now):
+        """Returns the bytes to send for a record and notes what answer to
+        wait for."""
+        if kind == PAYLOAD:
+            return data
+
+        line = data.decode(MessageProtocol.ENCODING, errors="replace").strip()
+        if kind == AUTH_FRAME and line:
+            if line.startswith(MessageProtocol.CMD_RESUME + " "):
+                nickname = decode_resume_token(
+                    line[len(MessageProtocol.CMD_RESUME) + 1 :]
+                )
+                if nickname:
+                    password = self.passwords.get(nickname, FALLBACK_PASSWORD)
+                    line = f"{nickname} {password}"
+                    data = line.encode(MessageProtocol.ENCODING)
+            self.nickname = line.split(" ", 1)[0]
+            self.logins.append(now)
+            return data + MessageProtocol.FRAME_DELIMITER
+
+        msg_id, _, text = MessageProtocol.split_message_id(line)
+        msg_type, _, content = MessageProtocol.parse_client_command(text)
+        if msg_id and msg_type in (
+            MessageProtocol.TYPE_PUBLIC,
+            MessageProtocol.TYPE_PRIVATE,
+        ):
+            self.acks[msg_id] = now
+        elif msg_type == MessageProtocol.TYPE_PUBLIC and content:
+            self.echoes[content].append(now)
+        elif msg_type == MessageProtocol.TYPE_PRIVATE:
+            self.private.append(now)
+        return data + MessageProtocol.FRAME_DELIMITER
+
+    def _answered(self, msg_type, data, now):
+        content = data.get("content", "") if isinstance(data, dict) else ""
+        if msg_type == MessageProtocol.TYPE_AUTH_SUCCESS and self.logins:
+            self.stats.latency["login"].append(now - self.logins.popleft())
+        elif msg_type == MessageProtocol.TYPE_AUTH_FAIL and self.logins:
+            self.logins.popleft()
+            self.stats.auth_failures += 1
+        elif msg_type == MessageProtocol.TYPE_ACK:
+            sent = self.acks.pop(data.get("id"), None)
+            if sent is not None:
+                self.stats.latency["ack"].append(now - sent)
+        elif msg_type == MessageProtocol.TYPE_PUBLIC:
+            if data.get("sender") == self.nickname:
+                text = content.partition(f"<{self.nickname}>: ")[2]
+                queue = self.echoes.get(text)
+                if queue:
+                    self.stats.latency["public"].append(now - queue.popleft())
+        elif msg_type == MessageProtocol.TYPE_SYSTEM:
+            if content.startswith(RATE_LIMIT_WARNING):
+                self.stats.rate_limited += 1
+            elif content.startswith(PRIVATE_NOTICES) and self.private:
+                self.stats.latency["private"].append(now - self.private.popleft())
+
+    async def _receive(self, reader):
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            now = loop.time()
+            self.stats.received_bytes += len(data)
+            for frame, _ in self.buffer.feed(data):
+                self.stats.received_frames += 1
+                msg_type, decoded = MessageProtocol.decode_message(frame)
+                if msg_type:
+                    self._answered(msg_type, decoded, now)
+
+    async def run(self, host, port, started, speed, drain):
+        loop = asyncio.get_running_loop()
+
+        async def wait_until(seconds):
+            if not speed:
+                return
+            due = started + seconds / speed
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.stats.lag.append(max(0.0, loop.time() - due))
+
+        kind, seconds, _ = self.records[0]
+        await wait_until(seconds)
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            self.stats.failed += 1
+            return
+        self.stats.connections += 1
+        receiver = loop.create_task(self._receive(reader))
+
+        try:
+            for kind, seconds, data in self.records[1:]:
+                if kind == CLOSE:
+                    break
+                if kind not in (FRAME, AUTH_FRAME, PAYLOAD):
+                    continue
+                await wait_until(seconds)
+                out = self._prepare(kind, data, loop.time())
+                writer.write(out)
+                self.stats.sent_bytes += len(out)
+                if kind != PAYLOAD:
+                    self.stats.sent_frames += 1
+                await writer.drain()
+
+            # The captured client hung up here; give the server's answers
+            # to what was just sent a chance to arrive first.
+            deadline = loop.time() + drain
+            while self.pending() and loop.time() < deadline and not receiver.done():
+                await asyncio.sleep(0.01)
+        except (ConnectionError, OSError):
+            self.stats.reset += 1
+        finally:
+            self.stats.unanswered += (
+                len(self.logins)
+                + len(self.acks)
+                + len(self.private)
+                + sum(map(len, self.echoes.values()))
+            )
+            receiver.cancel()
+            writer.close()
+
+
+async def replay(connections, passwords, args, host, port, stats):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    tasks = [
+        ReplayConnection(records, passwords, stats).run(
+            host, port, started, args.speed, args.drain
+        )
+        for records in connections.values()
+        if records and records[0][0] == OPEN
+    ]
+    await asyncio.gather(*tasks)
+    return loop.time() - started
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(workdir, no_rate_limit, timeout=10.0):
+    """Starts a headless server in workdir, so it begins with an empty user
+    database and logs, and waits until it accepts connections."""
+    port = free_port()
+    script = SERVER_SCRIPT.format(root=ROOT, port=port, no_rate_limit=no_rate_limit)
+    process = subprocess.Popen(
+        [sys.executable, "-c", script],
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.5).close()
+            return process, port
+        except OSError:
+            time.sleep(0.01)
+    process.kill()
+    raise RuntimeError(f"Server did not start within {timeout}s")
+
+
+def report(stats, elapsed, duration, speed):
+    elapsed = max(elapsed, 1e-6)
+    mode = f"{speed:g}x" if speed else "as fast as possible"
+    print("-" * 64)
+    print(
+        f"Replayed {stats.connections} connections ({stats.failed} failed, "
+        f"{stats.reset} reset) "
+        f"at {mode}: {elapsed:.2f}s for {duration:.2f}s of capture"
+    )
+    print(
+        f"Sent:     {stats.sent_frames} frames, {stats.sent_bytes} bytes "
+        f"({stats.sent_frames / elapsed:.0f} frames/s, "
+        f"{stats.sent_bytes / elapsed / 1024:.1f} KiB/s)"
+    )
+    print(
+        f"Received: {stats.received_frames} frames, {stats.received_bytes} bytes "
+        f"({stats.received_frames / elapsed:.0f} frames/s, "
+        f"{stats.received_bytes / elapsed / 1024:.1f} KiB/s)"
+    )
+    print(
+        f"Rate limited: {stats.rate_limited}, auth failures: {stats.auth_failures}, "
+        f"unanswered: {stats.unanswered}"
+    )
+    print("-" * 64)
+    print(
+        f"{'latency':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    )
+    rows = list(stats.latency.items())
+    if stats.lag:
+        rows.append(("sched. lag", stats.lag))
+    for name, samples in rows:
+        if not samples:
+            continue
+        print(
+            f"{name:<12}{len(samples):>8}"
+            + "".join(
+                f"{percentile(samples, fraction) * 1000:>10.2f}"
+                for fraction in (0.5, 0.95, 0.99)
+            )
+            + f"{max(samples) * 1000:>10.2f}"
+        )
+    print("-" * 64)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay a traffic capture against a chat server and report "
+        "throughput and latency."
+    )
+    parser.add_argument("capture")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="1 replays in real time, 10 ten times faster, 0 as fast as possible.",
+    )
+    parser.add_argument(
+        "--target",
+        help="host:port of a running server. By default a fresh headless "
+        "server is started on a free port.",
+    )
+    parser.add_argument(
+        "--no-rate-limit",
+        action="store_true",
+        help="Disable rate limiting on the started server, e.g. for speeds above 1.",
+    )
+    parser.add_argument(
+        "--drain",
+        type=float,
+        default=5.0,
+        help="Seconds each connection waits for outstanding answers before closing.",
+    )
+    args = parser.parse_args()
+
+    connections, passwords = load_capture(args.capture)
+    duration = max(
+        (records[-1][1] for records in connections.values() if records), default=0.0
+    )
+    raise_fd_limit()
+    stats = ReplayStats()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        if args.target:
+            host, _, port = args.target.rpartition(":")
+            port = int(port)
+        else:
+            process, port = spawn_server(workdir, args.no_rate_limit)
+            host = "127.0.0.1"
+        try:
+            elapsed = asyncio.run(
+                replay(connections, passwords, args, host, port, stats)
+            )
+        finally:
+            if process is not None:
+                process.kill()
+                process.wait()
+
+    report(stats, elapsed, duration, args.speed)